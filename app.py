@@ -1,7 +1,16 @@
-from flask import Flask, render_template, request, jsonify, session
-from models import SessionLocal, Scenario, ScenarioOverride
-from bot.parser import parse_query
+import json
+import gzip
+import zlib
+from flask import Flask, Response, render_template, request, jsonify, session, stream_with_context
+from models import SessionLocal, Scenario, SQLITE_INT_MIN, SQLITE_INT_MAX
+from bot.parser import parse_query, decode_cursor, fetch_page, cache_stats, constraint_parser
+from optimizer.promo_selector import load_catalog, select_promotions, save_selection, check_constraints
+from db.versions import bump_data_versions
+from db.export import iter_export_lines, EXPORT_FORMATS
+from db.scenarios import diff_scenarios, effective_overrides, save_overrides, scenario_version_key, missing_scenarios
+from config.settings import STREAM_CHUNK_SIZE, GZIP_MIN_BYTES, GZIP_LEVEL, DIFF_ENTRY_LIMIT
 from contextlib import contextmanager
+from itertools import islice
 from datetime import datetime
 from sqlalchemy.orm import Session
 
@@ -46,6 +55,11 @@ def chat():
     if not user_query:
         return jsonify({"error": "No query provided"}), 400
 
+    columnar = wants_columnar(data)
+
+    if wants_stream(data):
+        return ndjson_response(stream_chat(user_query, columnar))
+
     with get_db() as db:
         parsed = parse_query(user_query, db)
 
@@ -59,13 +73,174 @@ def chat():
             session["scenario_changes"] = []
         session["scenario_changes"].extend(parsed["modifications"])
 
-    return jsonify({
-        "response": parsed.get("result"),
+    result, vis = parsed.get("result"), parsed.get("visualization")
+    if columnar:
+        result, vis = columnar_answer(result, vis)
+
+    return json_response({
+        "response": result,
         "nlg": nlg_text, 
-        "visualization": parsed.get("visualization")
+        "visualization": vis,
+        "next_cursor": parsed.get("next_cursor")
     })
 
 
+@app.route("/api/chat/page", methods=["POST"])
+def chat_page():
+    data = request.get_json() or {}
+    cursor = data.get("cursor")
+    if not cursor:
+        return jsonify({"error": "cursor required"}), 400
+
+    try:
+        state = decode_cursor(cursor)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with get_db() as db:
+        rows, next_cursor = fetch_page(db, state["intent"], state["filters"], state["after"])
+
+    result, vis = rows, {"chartType": "table", "data": rows}
+    if wants_columnar(data):
+        result, vis = columnar_answer(result, vis)
+
+    return json_response({
+        "response": result,
+        "visualization": vis,
+        "next_cursor": next_cursor
+    })
+
+
+# =====================================
+# Streaming chat (NDJSON)
+# =====================================
+
+def wants_stream(data):
+    """Client opted into NDJSON via the Accept header or {"stream": true}."""
+    if data.get("stream"):
+        return True
+    best = request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"])
+    return best == "application/x-ndjson"
+
+
+def ndjson_line(obj):
+    return json.dumps(obj, separators=(",", ":"), default=str) + "\n"
+
+
+def ndjson_response(lines, mimetype="application/x-ndjson"):
+    """Wrap a line generator in a streaming (optionally gzipped) response."""
+    if accepts_gzip():
+        resp = Response(stream_with_context(gzip_stream(lines)), mimetype=mimetype)
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = Response(stream_with_context(lines), mimetype=mimetype)
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+def stream_chat(user_query, columnar=False):
+    """
+    Stream a chat answer as NDJSON lines:
+      {"type": "meta", "nlg": ..., "visualization": {...}}   (no row data)
+      {"type": "rows", "rows": [...]}                         (repeated)
+      {"type": "end", "count": N}
+    Rows are pulled from a server-side cursor, so nothing beyond one chunk
+    is held in memory and the first line goes out before any row is read.
+    With columnar=True each rows line is {"type": "rows", "columns": [...], "values": [...]}.
+    """
+    with get_db() as db:
+        parsed = parse_query(user_query, db, stream=True)
+        result = parsed.get("result")
+
+        nlg_text = parsed.get("nlg", "")
+        if not isinstance(nlg_text, str):
+            nlg_text = str(nlg_text)
+
+        vis = parsed.get("visualization")
+        meta = {"type": "meta", "nlg": nlg_text, "visualization": vis}
+        if isinstance(result, dict):
+            # Single-object answers (e.g. what-if) travel in the meta line
+            meta["response"] = result
+            result = []
+        elif vis:
+            # Chart data is rebuilt client-side from the streamed rows
+            meta["visualization"] = {k: v for k, v in vis.items() if k != "data"}
+        yield ndjson_line(meta)
+
+        rows = iter(result or [])
+        count = 0
+        try:
+            while True:
+                chunk = list(islice(rows, STREAM_CHUNK_SIZE))
+                if not chunk:
+                    break
+                count += len(chunk)
+                if columnar:
+                    yield ndjson_line({"type": "rows", **to_columnar(chunk)})
+                else:
+                    yield ndjson_line({"type": "rows", "rows": chunk})
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            yield ndjson_line({"type": "error", "error": str(e)})
+            raise
+
+        yield ndjson_line({"type": "end", "count": count})
+
+
+# =====================================
+# Response encoding (columnar + gzip)
+# =====================================
+
+def wants_columnar(data=None):
+    """Client opted into columnar tables via {"format": "columnar"} or ?format=columnar."""
+    fmt = (data or {}).get("format") or request.args.get("format")
+    return fmt == "columnar"
+
+
+def to_columnar(rows):
+    """
+    [{"a": 1, "b": 2}, {"a": 3, "b": 4}] -> {"columns": ["a", "b"], "values": [[1, 3], [2, 4]]}
+    """
+    columns = list(rows[0]) if rows else []
+    return {"columns": columns, "values": [[r.get(c) for r in rows] for c in columns]}
+
+
+def columnar_answer(result, vis):
+    """
+    Encode a list result as a single columnar table. The visualization keeps
+    only its chartType/config and reads its columns from the response, so
+    rows are not sent twice.
+    """
+    if not isinstance(result, list):
+        return result, vis
+    if vis:
+        vis = {k: v for k, v in vis.items() if k != "data"}
+    return to_columnar(result), vis
+
+
+def accepts_gzip():
+    return request.accept_encodings["gzip"] > 0
+
+
+def json_response(payload, status=200):
+    """Compact JSON response, gzipped when the client accepts it and the body is large enough."""
+    body = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    resp = Response(body, status=status, mimetype="application/json")
+    resp.vary.add("Accept-Encoding")
+    if len(body) >= GZIP_MIN_BYTES and accepts_gzip():
+        resp.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        resp.headers["Content-Encoding"] = "gzip"
+    return resp
+
+
+def gzip_stream(lines):
+    """Gzip a line generator, flushing after every line so the client can decode it immediately."""
+    z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for line in lines:
+        yield z.compress(line.encode()) + z.flush(zlib.Z_SYNC_FLUSH)
+    yield z.flush()
+
+
 @app.route("/api/scenario/start", methods=["POST"])
 def start_scenario():
     data = request.get_json() or {}
@@ -82,6 +257,7 @@ def start_scenario():
         db.add(new_scenario)
         db.flush()
         scenario_id = new_scenario.scenario_id   # correct ID field
+        bump_data_versions(db, "scenario", scenario_version_key(scenario_id))
 
     session["active_scenario_id"] = scenario_id
     session["scenario_changes"] = []
@@ -103,14 +279,46 @@ def load_scenario():
         scenario = db.query(Scenario).filter_by(scenario_id=scenario_id).first()
         scenario_name = scenario.name if scenario else "Unknown"
 
-    return jsonify({
+    return json_response({
         "status": "loaded",
         "scenario_id": scenario_id,
         "scenario_name": scenario_name,
-        "overrides": overrides_json
+        "overrides": to_columnar(overrides_json) if wants_columnar(data) else overrides_json
     })
 
 
+@app.route("/api/scenario/clone", methods=["POST"])
+def clone_scenario():
+    """
+    Copy-on-write clone: a new scenario that inherits the overrides and
+    promotion selection of `scenario_id` without copying any rows. Later
+    saves of the clone store only its own delta.
+    """
+    data = request.get_json() or {}
+    parent_id = data.get("scenario_id")
+
+    if not parent_id:
+        return jsonify({"error": "scenario_id required"}), 400
+
+    with get_db() as db:
+        parent = db.query(Scenario).filter_by(scenario_id=parent_id).first()
+        if not parent:
+            return jsonify({"error": f"Scenario {parent_id} not found"}), 404
+
+        clone = Scenario(
+            name=data.get("name") or f"{parent.name} (copy)",
+            description=f"Clone of {parent.name}",
+            type=parent.type,
+            parent_id=parent.scenario_id,
+            created_at=datetime.utcnow()
+        )
+        db.add(clone)
+        db.flush()
+        clone_id, clone_name = clone.scenario_id, clone.name
+        bump_data_versions(db, "scenario", scenario_version_key(clone_id))
+
+    return jsonify({"scenario_id": clone_id, "scenario_name": clone_name, "parent_id": parent_id, "status": "cloned"})
+
 
 @app.route("/api/scenario/list")
 def list_scenarios():
@@ -123,8 +331,8 @@ def list_scenarios():
             if s.scenario_id in seen:
                 continue
             seen.add(s.scenario_id)
-            result.append({"id": s.scenario_id, "name": s.name, "type": s.type})
-    return jsonify({"scenarios": result})
+            result.append({"id": s.scenario_id, "name": s.name, "type": s.type, "parent_id": s.parent_id})
+    return json_response({"scenarios": to_columnar(result) if wants_columnar() else result})
 
 
 @app.route("/api/scenario/save", methods=["POST"])
@@ -149,7 +357,6 @@ def save_scenario():
             if existing:
                 # treat it as update instead of creating duplicate
                 scenario_id = existing.scenario_id
-                db.query(ScenarioOverride).filter_by(scenario_id=scenario_id).delete()
                 scenario = existing
             else:
                 new_scenario = Scenario(
@@ -170,18 +377,15 @@ def save_scenario():
                 return jsonify({"error": f"Scenario {scenario_id} not found"}), 404
             if scenario_name:
                 scenario.name = scenario_name
-            db.query(ScenarioOverride).filter_by(scenario_id=scenario_id).delete()
-
-        # ---------- INSERT NEW OVERRIDES ----------
-        for c in changes:
-            override = ScenarioOverride(
-                scenario_id=scenario_id,
-                table_name=c.get("table"),
-                row_id=c.get("row_id"),
-                column_name=c.get("column"),
-                override_value=str(c.get("new_value"))
-            )
-            db.add(override)
+
+        # ---------- REPLACE OVERRIDES ----------
+        # Clones keep only their delta (see db.scenarios.save_overrides)
+        try:
+            save_overrides(db, scenario, changes)
+        except ValueError as e:
+            db.rollback()
+            return jsonify({"error": str(e)}), 400
+        bump_data_versions(db, "scenario")
 
         saved_name = scenario.name
         saved_id = scenario_id
@@ -196,28 +400,128 @@ def save_scenario():
         session.pop("scenario_changes", None)
         session.pop("scenario_mode", None)
 
-    return jsonify({
+    return json_response({
         "status": "saved",
         "scenario_id": saved_id,
         "scenario_name": saved_name,
-        "overrides": overrides_json
+        "overrides": to_columnar(overrides_json) if wants_columnar(data) else overrides_json
     })
 
 
+@app.route("/api/scenario/optimize", methods=["POST"])
+def optimize_scenario():
+    """
+    Select the profit-maximizing promotions for a scenario and store them as
+    its ScenarioPromotion selection. Constraints come from `query` (parsed
+    like a chat message) and/or an explicit `constraints` list.
+    """
+    data = request.get_json() or {}
+    scenario_id = data.get("scenario_id")
+    mode = data.get("mode", "fast")
+
+    if not scenario_id:
+        return jsonify({"error": "scenario_id required"}), 400
+    if mode not in ("fast", "exact"):
+        return jsonify({"error": "mode must be 'fast' or 'exact'"}), 400
+
+    if not isinstance(data.get("query", ""), str):
+        return jsonify({"error": "query must be a string"}), 400
+    try:
+        check_constraints(data.get("constraints", []))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    constraints = constraint_parser(data.get("query", "")) + data.get("constraints", [])
+
+    options = {}
+    if data.get("time_limit") is not None:
+        try:
+            time_limit = float(data["time_limit"])
+        except (TypeError, ValueError):
+            time_limit = 0.0
+        if not 0 < time_limit < float("inf"):
+            return jsonify({"error": "time_limit must be a positive number of seconds"}), 400
+        options["time_limit"] = time_limit
+
+    with get_db() as db:
+        scenario = db.query(Scenario).filter_by(scenario_id=scenario_id).first()
+        if not scenario:
+            return jsonify({"error": f"Scenario {scenario_id} not found"}), 404
+
+        selection = select_promotions(load_catalog(db), constraints, mode=mode, **options)
+        save_selection(db, scenario_id, selection["selected_ids"])
+
+    selection.pop("selected_ids")
+    selection["solver_status"] = selection.pop("status")
+    return json_response({"status": "optimized", "scenario_id": scenario_id, "constraints": constraints, **selection})
+
+
+@app.route("/api/scenario/export")
+def export_scenarios():
+    """
+    Stream overrides, selected promotions and KPIs for ?ids=1,2 (default: all
+    scenarios) as ?format=csv|ndjson, read in fixed-size cursor batches.
+    """
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {sorted(EXPORT_FORMATS)}"}), 400
+
+    ids = request.args.get("ids")
+    try:
+        scenario_ids = [int(i) for i in ids.split(",") if i.strip()] if ids else None
+    except ValueError:
+        return jsonify({"error": "ids must be a comma-separated list of scenario ids"}), 400
+    if scenario_ids and not all(SQLITE_INT_MIN <= i <= SQLITE_INT_MAX for i in scenario_ids):
+        return jsonify({"error": "scenario ids out of range"}), 400
+
+    if scenario_ids:
+        with get_db() as db:
+            missing = missing_scenarios(db, scenario_ids)
+        if missing:
+            return jsonify({"error": f"Scenario {missing[0]} not found"}), 404
+
+    def generate():
+        with get_db() as db:
+            yield from iter_export_lines(db, scenario_ids, fmt)
+
+    resp = ndjson_response(generate(), mimetype=EXPORT_FORMATS[fmt])
+    resp.headers["Content-Disposition"] = f"attachment; filename=scenarios.{fmt}"
+    return resp
+
+
+@app.route("/api/scenario/diff")
+def diff_scenario():
+    """
+    Override diff (added / removed / changed, keyed on table_name, row_id,
+    column_name) and KPI deltas between ?base=<id> and ?other=<id>.
+    """
+    try:
+        base_id = int(request.args["base"])
+        other_id = int(request.args["other"])
+        limit = int(request.args.get("limit", DIFF_ENTRY_LIMIT))
+    except (KeyError, ValueError):
+        return jsonify({"error": "integer base and other scenario ids required"}), 400
+    if not all(SQLITE_INT_MIN <= i <= SQLITE_INT_MAX for i in (base_id, other_id)):
+        return jsonify({"error": "scenario ids out of range"}), 400
+
+    with get_db() as db:
+        missing = missing_scenarios(db, [base_id, other_id])
+        if missing:
+            return jsonify({"error": f"Scenario {missing[0]} not found"}), 404
+        diff = diff_scenarios(db, base_id, other_id, limit)
+
+    return json_response({"base": base_id, "other": other_id, **diff})
+
+
+@app.route("/api/cache/stats")
+def get_cache_stats():
+    return jsonify(cache_stats())
+
+
 #   Refactor your load logic into a helper function, then call it both from save_scenario and load_scenario.
 
 def hydrate_scenario_in_session(db, scenario_id, edit_mode=False):
-    overrides = db.query(ScenarioOverride).filter_by(scenario_id=scenario_id).all()
-    overrides_json = [
-        {
-            "id": o.id,
-            "table_name": o.table_name,
-            "row_id": o.row_id,
-            "column_name": o.column_name,
-            "override_value": o.override_value
-        }
-        for o in overrides
-    ]
+    # Effective overrides: clones include what they inherit from their parents
+    overrides_json = list(effective_overrides(db, scenario_id).values())
 
     if edit_mode:
         # Scenario user can edit
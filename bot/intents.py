@@ -0,0 +1,28 @@
+# intents.py
+
+# Keywords that pick each chat intent in stub-classifier mode
+INTENT_KEYWORDS = {
+    "list promotions": ["list", "show promotions", "all promotions"],
+    "summarize promotion impact": ["summarize", "summary", "impact"],
+    "compare scenarios": ["compare", "versus", " vs "],
+    "show assumptions": ["assumption"],
+    "what if": ["what if", "what-if"],
+    "optimize promotions": ["optimize", "optimise", "best promotions", "select promotions"],
+}
+
+
+def keyword_classifier(user_input: str, candidate_labels: list) -> dict:
+    """
+    Drop-in stand-in for the zero-shot pipeline, used when the model is
+    switched off (OPTIGUIDE_STUB_CLASSIFIER=1) to measure everything but
+    the model. Labels whose keywords appear in the query rank first, in
+    candidate order; the rest follow unchanged.
+
+    Returns:
+        dict: {"sequence", "labels", "scores"} like the transformers pipeline.
+    """
+    text = user_input.lower()
+    hits = [l for l in candidate_labels if any(k in text for k in INTENT_KEYWORDS.get(l, []))]
+    labels = hits + [l for l in candidate_labels if l not in hits]
+    scores = [1.0 if l in hits else 0.0 for l in labels]
+    return {"sequence": user_input, "labels": labels, "scores": scores}
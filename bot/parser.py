@@ -1,12 +1,110 @@
 import re
+import json
+import base64
+from collections.abc import Iterator
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
-from transformers import pipeline
-from models import Promotion, Scenario, FinanceAssumption, SupplyAssumption
+from models import Promotion, Product, Retailer, Scenario, SQLITE_INT_MIN, SQLITE_INT_MAX
+from config.settings import (
+    STREAM_BATCH_SIZE, CHAT_PAGE_SIZE, CLASSIFY_CACHE_SIZE, ANSWER_CACHE_SIZE, COUNT_CACHE_SIZE,
+    STREAM_CACHE_ROWS, STUB_CLASSIFIER
+)
+from bot.cache import ResponseCache
+from db.versions import get_data_versions
+from db.scenarios import scenario_kpis
+from db.assumptions import ASSUMPTION_MODELS, assumption_types, assumption_query, assumption_row, count_assumptions
+from optimizer.promo_selector import load_catalog, select_promotions, selection_rows
 
 # -----------------------------
 # Zero-shot intent classifier
 # -----------------------------
-classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
+if STUB_CLASSIFIER:
+    # Keyword matching instead of the model (load testing the non-model path)
+    from bot.intents import keyword_classifier as classifier
+else:
+    from transformers import pipeline
+    classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
+
+candidate_labels = [
+    "list promotions",
+    "summarize promotion impact",
+    "compare scenarios",
+    "show assumptions",
+    "what if",
+    "optimize promotions"
+]
+
+# Tables each intent reads; cached answers are tagged with their versions
+INTENT_TABLES = {
+    "list promotions": ["promotion", "product", "retailer"],
+    "summarize promotion impact": ["promotion", "product", "retailer"],
+    "compare scenarios": ["scenario", "scenario_promotion", "promotion"],
+    "show assumptions": ["finance_assumption", "supply_assumption"],
+    "what if": [],
+    "optimize promotions": ["promotion", "product", "retailer"],
+}
+
+# -----------------------------
+# parse_query caches
+# -----------------------------
+classify_cache = ResponseCache(CLASSIFY_CACHE_SIZE)
+answer_cache = ResponseCache(ANSWER_CACHE_SIZE)
+count_cache = ResponseCache(COUNT_CACHE_SIZE)
+
+
+def normalize_query(user_input: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation."""
+    return " ".join(user_input.lower().split()).rstrip("?!. ")
+
+
+def classify_intent(user_input: str) -> str:
+    """
+    Top zero-shot label for the query, memoized on the normalized text.
+    """
+    key = normalize_query(user_input)
+    intent = classify_cache.get(key)
+    if intent is None:
+        classification = classifier(user_input, candidate_labels)
+        intent = classification['labels'][0]
+        classify_cache.put(key, intent)
+    return intent
+
+
+def answer_key(intent: str, constraints: list, user_input: str):
+    """
+    Cache key for a resolved answer: the intent plus its constraints, so
+    paraphrases that resolve identically share an entry. "what if" answers
+    also depend on the promotion/discount in the text itself, and
+    "show assumptions" answers on the assumption filters it names.
+    """
+    key = (intent, json.dumps(constraints, sort_keys=True))
+    if intent == "what if":
+        key += (normalize_query(user_input),)
+    elif intent == "show assumptions":
+        key += (json.dumps(assumption_filters(user_input), sort_keys=True),)
+    return key
+
+
+def cached_count(db: Session, intent: str, filters: dict, count) -> int:
+    """
+    Row total of a table intent, recounted only when a table it reads
+    changes (a full COUNT is O(table), too much for every first page).
+    """
+    key = (intent, json.dumps(filters, sort_keys=True))
+    versions = get_data_versions(db, INTENT_TABLES[intent])
+    total = count_cache.get(key, versions)
+    if total is None:
+        total = count(db, filters)
+        count_cache.put(key, total, versions)
+    return total
+
+
+def cache_stats() -> dict:
+    return {
+        "classification": classify_cache.stats(),
+        "answers": answer_cache.stats(),
+        "counts": count_cache.stats()
+    }
 
 # =============================
 # Constraint Parser (internal)
@@ -65,85 +163,344 @@ def constraint_parser(user_input: str) -> list:
 
     return constraints
 
+# =============================
+# Row producers
+# =============================
+def promotion_filters(constraints: list) -> dict:
+    """
+    Row filters for the promotion table intents, derived from the parsed constraints.
+    """
+    retailers = [c["channel"] for c in constraints if c["type"] == "channel_include"]
+    return {"retailers": retailers} if retailers else {}
+
+
+def retailer_ids(db: Session, names: list) -> list:
+    """Ids of the retailers with the given names."""
+    return db.scalars(select(Retailer.id).where(Retailer.name.in_(names))).all()
+
+
+def promotion_query(after: int = None, retailers: list = None):
+    """
+    Promotions joined with product/retailer names in a single SELECT,
+    ordered by promotion id. `after` restarts the scan past a promotion id
+    (keyset pagination on the primary key, no OFFSET).
+
+    `retailers` are retailer ids resolved from filters["retailers"] (see
+    retailer_ids()); literal ids let SQLite read ix_promotion_retailer_page
+    in id order instead of walking every promotion.
+    """
+    stmt = (
+        select(
+            Promotion.id,
+            Product.name.label("product"),
+            Retailer.name.label("retailer"),
+            Promotion.week,
+            Promotion.discount_depth,
+            Promotion.tactic,
+            Promotion.est_incremental_units,
+            Promotion.est_incremental_revenue,
+            Promotion.est_incremental_profit
+        )
+        .outerjoin(Product, Promotion.product_id == Product.id)
+        .outerjoin(Retailer, Promotion.retailer_id == Retailer.id)
+        .order_by(Promotion.id)
+    )
+    if retailers is not None:
+        stmt = stmt.where(Promotion.retailer_id.in_(retailers))
+    if after is not None:
+        stmt = stmt.where(Promotion.id > after)
+    return stmt
+
+
+def count_promotions(db: Session, filters: dict = None) -> int:
+    filters = filters or {}
+    stmt = select(func.count(Promotion.id))
+    if filters.get("retailers"):
+        stmt = stmt.where(Promotion.retailer_id.in_(retailer_ids(db, filters["retailers"])))
+    return db.scalar(stmt)
+
+
+def _keyed_promotion_rows(db: Session, filters: dict = None, after=None,
+                          limit: int = None, batch_size: int = STREAM_BATCH_SIZE):
+    """Yield (keyset key, "list promotions" row) pairs."""
+    filters = filters or {}
+    retailers = retailer_ids(db, filters["retailers"]) if filters.get("retailers") else None
+    stmt = promotion_query(after, retailers)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    rows = db.execute(stmt.execution_options(yield_per=batch_size))
+    for r in rows:
+        yield r.id, {
+            "promotion_id": r.id,
+            "product": r.product,
+            "retailer": r.retailer,
+            "week": r.week,
+            "discount_depth": r.discount_depth,
+            "tactic": r.tactic,
+            "incremental_units": r.est_incremental_units,
+            "incremental_revenue": r.est_incremental_revenue,
+            "incremental_profit": r.est_incremental_profit
+        }
+
+
+def iter_promotion_rows(db: Session, filters: dict = None, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    Yield "list promotions" rows from a server-side cursor,
+    fetching `batch_size` rows per round-trip.
+    """
+    for _, row in _keyed_promotion_rows(db, filters, batch_size=batch_size):
+        yield row
+
+
+def iter_promotion_impact_rows(db: Session, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    Yield "summarize promotion impact" rows from a server-side cursor.
+    """
+    rows = db.execute(promotion_query().execution_options(yield_per=batch_size))
+    for r in rows:
+        yield {
+            "promotion": f"{r.product} @ {r.retailer}",
+            "units": r.est_incremental_units or 0,
+            "revenue": r.est_incremental_revenue or 0,
+            "profit": r.est_incremental_profit or 0
+        }
+
+
+def assumption_filters(user_input: str) -> dict:
+    """
+    Row filters for "show assumptions": a "finance"/"supply" type, a
+    "scenario <id>" and any snake_case assumption keys named in the text.
+    """
+    text = user_input.lower()
+    filters = {}
+    types = [t for t in ASSUMPTION_MODELS if t in text]
+    if types:
+        filters["types"] = types
+    scenario = re.search(r"scenario\s*#?(\d+)", text)
+    if scenario:
+        filters["scenario_id"] = int(scenario.group(1))
+    keys = re.findall(r"\b[a-z]+(?:_[a-z]+)+\b", text)
+    if keys:
+        filters["keys"] = keys
+    return filters
+
+
+def _keyed_assumption_rows(db: Session, filters: dict = None, after=None,
+                           limit: int = None, batch_size: int = STREAM_BATCH_SIZE):
+    """Yield ([kind, id], "show assumptions" row) pairs; the keyset key is [kind, id]."""
+    after_kind, after_id = after if after else (None, None)
+    kinds = list(ASSUMPTION_MODELS)
+    remaining = limit
+
+    for kind in assumption_types(filters):
+        if after_kind and kinds.index(kind) < kinds.index(after_kind):
+            continue
+        if remaining is not None and remaining <= 0:
+            return
+
+        model = ASSUMPTION_MODELS[kind]
+        stmt = assumption_query(model, filters)
+        if kind == after_kind:
+            stmt = stmt.where(model.id > after_id)
+        if remaining is not None:
+            stmt = stmt.limit(remaining)
+
+        for a in db.execute(stmt.execution_options(yield_per=batch_size)):
+            if remaining is not None:
+                remaining -= 1
+            yield [kind, a.id], assumption_row(kind, a)
+
+
+def iter_assumption_rows(db: Session, filters: dict = None, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    Yield "show assumptions" rows (finance, then supply) from server-side cursors.
+    """
+    for _, row in _keyed_assumption_rows(db, filters, batch_size=batch_size):
+        yield row
+
+# =============================
+# Keyset pagination
+# =============================
+# Table intents that can be paged, with their keyed row producers
+PAGED_INTENTS = {
+    "list promotions": _keyed_promotion_rows,
+    "show assumptions": _keyed_assumption_rows,
+}
+
+
+def _is_int(value) -> bool:
+    # Out-of-range ids would raise OverflowError when bound to the query
+    return isinstance(value, int) and not isinstance(value, bool) and SQLITE_INT_MIN <= value <= SQLITE_INT_MAX
+
+
+def _is_str_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
+def _is_assumption_key(value) -> bool:
+    return (isinstance(value, list) and len(value) == 2 and isinstance(value[0], str)
+            and value[0] in ASSUMPTION_MODELS and _is_int(value[1]))
+
+
+# Shape checks for decoded cursors: the keyset key and each allowed filter
+CURSOR_KEYS = {
+    "list promotions": _is_int,
+    "show assumptions": _is_assumption_key,
+}
+CURSOR_FILTERS = {
+    "list promotions": {"retailers": _is_str_list},
+    "show assumptions": {"types": _is_str_list, "scenario_id": _is_int, "keys": _is_str_list},
+}
+
+
+def encode_cursor(intent: str, filters: dict, after) -> str:
+    """
+    Opaque page cursor: the intent, its row filters and the last-seen key.
+    """
+    payload = json.dumps({"intent": intent, "filters": filters, "after": after}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Decode a cursor from encode_cursor(). Raises ValueError if it is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(state, dict) or state.get("intent") not in PAGED_INTENTS:
+        raise ValueError("Invalid cursor")
+    intent, filters, after = state["intent"], state.get("filters"), state.get("after")
+    if not isinstance(filters, dict) or not CURSOR_KEYS[intent](after):
+        raise ValueError("Invalid cursor")
+    checks = CURSOR_FILTERS[intent]
+    if any(name not in checks or not checks[name](value) for name, value in filters.items()):
+        raise ValueError("Invalid cursor")
+    return state
+
+
+def fetch_page(db: Session, intent: str, filters: dict = None, after=None,
+               page_size: int = CHAT_PAGE_SIZE):
+    """
+    Fetch one page of a table intent with an indexed keyset query.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    filters = filters or {}
+    keyed = list(PAGED_INTENTS[intent](db, filters, after, limit=page_size + 1))
+    rows = [row for _, row in keyed[:page_size]]
+    next_cursor = None
+    if len(keyed) > page_size:
+        next_cursor = encode_cursor(intent, filters, keyed[page_size - 1][0])
+    return rows, next_cursor
+
 # =============================
 # Main Query Parser
 # =============================
-def parse_query(user_input: str, db: Session) -> dict:
+def parse_query(user_input: str, db: Session, stream: bool = False) -> dict:
     """
     Convert user natural language query into structured response + visualization.
     Constraints are extracted internally for backend processing only.
+
+    Table intents ("list promotions", "show assumptions") return the first
+    page of rows plus a `next_cursor` for /api/chat/page.
+
+    With stream=True, table and promotion intents instead return `result` as a
+    row generator reading from a server-side cursor, and the visualization
+    carries only its chartType/config (the client builds the chart from the
+    streamed rows). The generator is only valid while `db` stays open.
+
+    Classification is memoized on the normalized text, and answers are cached
+    on intent + constraints until a table they read changes. Streamed answers
+    are cached once fully read if they have at most STREAM_CACHE_ROWS rows,
+    and replayed from the cached rows.
     """
     # --- Extract constraints (internal use) ---
     constraints = constraint_parser(user_input)
 
     # --- Intent classification ---
-    candidate_labels = [
-        "list promotions",
-        "summarize promotion impact",
-        "compare scenarios",
-        "show assumptions",
-        "what if"
-    ]
-    classification = classifier(user_input, candidate_labels)
-    intent = classification['labels'][0]
+    intent = classify_intent(user_input)
+
+    key = answer_key(intent, constraints, user_input) + (stream,)
+    versions = get_data_versions(db, INTENT_TABLES.get(intent, []))
+    parsed = answer_cache.get(key, versions)
+    if parsed is None:
+        parsed = answer_query(intent, constraints, user_input, db, stream=stream)
+        rows = parsed.get("result")
+        if stream and isinstance(rows, Iterator):
+            parsed["result"] = _cache_streamed_rows(rows, parsed, key, versions)
+        else:
+            answer_cache.put(key, parsed, versions)
+    return dict(parsed)
+
 
+def _cache_streamed_rows(rows, parsed: dict, key, versions: dict, limit: int = STREAM_CACHE_ROWS):
+    """
+    Pass streamed rows through, keeping a copy while there are at most
+    `limit`; an answer that was read to the end within the limit is cached.
+    """
+    kept = []
+    for row in rows:
+        if kept is not None:
+            kept.append(row)
+            if len(kept) > limit:
+                kept = None
+        yield row
+    if kept is not None:
+        answer_cache.put(key, {**parsed, "result": kept}, versions)
+
+
+def answer_query(intent: str, constraints: list, user_input: str, db: Session, stream: bool = False) -> dict:
+    """
+    Build the result/NLG/visualization for an already classified query.
+    """
     result = {}
     vis = None
     nlg = ""
+    next_cursor = None
 
     # ------------------------
     # 1. List promotions
     # ------------------------
     if intent == "list promotions":
-        promos = db.query(Promotion).all()
-        result = [
-            {
-                "promotion_id": p.id,
-                "product": p.product.name if p.product else None,
-                "retailer": p.retailer.name if p.retailer else None,
-                "week": p.week,
-                "discount_depth": p.discount_depth,
-                "tactic": p.tactic,
-                "incremental_units": p.est_incremental_units,
-                "incremental_revenue": p.est_incremental_revenue,
-                "incremental_profit": p.est_incremental_profit
-            }
-            for p in promos
-        ]
-        vis = {"chartType": "table", "data": result}
-        nlg = f"I found {len(result)} promotions in the system."
+        filters = promotion_filters(constraints)
+        total = cached_count(db, intent, filters, count_promotions)
+        if stream:
+            result = iter_promotion_rows(db, filters)
+            vis = {"chartType": "table"}
+        else:
+            result, next_cursor = fetch_page(db, intent, filters)
+            vis = {"chartType": "table", "data": result}
+        nlg = f"I found {total} promotions in the system."
 
     # ------------------------
     # 2. Summarize promotion impact
     # ------------------------
     elif intent == "summarize promotion impact":
-        promos = db.query(Promotion).all()
-        result = [
-            {
-                "promotion": f"{p.product.name} @ {p.retailer.name}",
-                "units": p.est_incremental_units or 0,
-                "revenue": p.est_incremental_revenue or 0,
-                "profit": p.est_incremental_profit or 0
-            }
-            for p in promos
-        ]
         vis = {
             "chartType": "bar",
-            "data": [{"promotion": r["promotion"], "revenue": r["revenue"]} for r in result],
             "config": {"x": "promotion", "y": "revenue", "title": "Incremental Revenue by Promotion"}
         }
+        if stream:
+            result = iter_promotion_impact_rows(db)
+        else:
+            result = list(iter_promotion_impact_rows(db))
+            vis["data"] = [{"promotion": r["promotion"], "revenue": r["revenue"]} for r in result]
         nlg = "Here’s the estimated incremental revenue impact by promotion."
 
     # ------------------------
     # 3. Compare scenarios
     # ------------------------
     elif intent == "compare scenarios":
-        scenarios = db.query(Scenario).all()
-        result = []
-        for s in scenarios:
-            revenue = sum(p.promotion.est_incremental_revenue or 0 for p in s.tpo_promotions if p.selected)
-            profit = sum(p.promotion.est_incremental_profit or 0 for p in s.tpo_promotions if p.selected)
-            result.append({"scenario": s.name, "revenue": revenue, "profit": profit})
+        # Same lineage-aware totals as the diff and export (clones inherit selections)
+        scenarios = db.execute(select(Scenario.scenario_id, Scenario.name).order_by(Scenario.scenario_id)).all()
+        kpis = scenario_kpis(db, [sid for sid, _ in scenarios])
+        result = [
+            {"scenario": name, "revenue": kpis[sid]["revenue"], "profit": kpis[sid]["profit"]}
+            for sid, name in scenarios
+        ]
         vis = {
             "chartType": "bar",
             "data": result,
@@ -155,10 +512,17 @@ def parse_query(user_input: str, db: Session) -> dict:
     # 4. Show assumptions
     # ------------------------
     elif intent == "show assumptions":
-        assumptions = db.query(FinanceAssumption).all() + db.query(SupplyAssumption).all()
-        result = [{"scenario_id": a.scenario_id, "key": a.key, "value": a.value} for a in assumptions]
-        vis = {"chartType": "table", "data": result}
-        nlg = f"Found {len(result)} finance/supply assumptions across scenarios."
+        filters = assumption_filters(user_input)
+        total = cached_count(db, intent, filters, count_assumptions)
+        if stream:
+            result = iter_assumption_rows(db, filters)
+            vis = {"chartType": "table"}
+        else:
+            result, next_cursor = fetch_page(db, intent, filters)
+            vis = {"chartType": "table", "data": result}
+        kinds = "/".join(assumption_types(filters))
+        scope = f"scenario {filters['scenario_id']}" if "scenario_id" in filters else "scenarios"
+        nlg = f"Found {total} {kinds} assumptions across {scope}."
 
     # ------------------------
     # 5. What-if override
@@ -174,6 +538,23 @@ def parse_query(user_input: str, db: Session) -> dict:
         else:
             nlg = "Please specify which promotion and new discount you want to test."
 
+    # ------------------------
+    # 6. Optimize promotion selection
+    # ------------------------
+    elif intent == "optimize promotions":
+        # Read-only here (answers are cached); /api/scenario/optimize writes selections back
+        catalog = load_catalog(db)
+        selection = select_promotions(catalog, constraints)
+        result = selection_rows(catalog, selection["selected_ids"])
+        vis = {"chartType": "table", "data": result}
+        nlg = (
+            f"Selected {selection['count']} of {selection['candidates']} eligible promotions: "
+            f"${selection['profit']:,.0f} incremental profit on ${selection['spend']:,.0f} estimated trade spend."
+        )
+        if selection["ignored_constraints"]:
+            ignored = ", ".join(c["type"] for c in selection["ignored_constraints"])
+            nlg += f" Not applied: {ignored}."
+
     else:
         nlg = "Sorry, I couldn’t interpret your request."
 
@@ -181,4 +562,7 @@ def parse_query(user_input: str, db: Session) -> dict:
     # Return only NLG + visualization + result
     # Constraints stay internal for backend
     # ------------------------
-    return {"result": result, "nlg": nlg, "visualization": vis, "constraints": constraints}
+    return {
+        "result": result, "nlg": nlg, "visualization": vis,
+        "constraints": constraints, "next_cursor": next_cursor
+    }
@@ -0,0 +1,35 @@
+import sys
+import os
+
+# Ensure imports work when running from bot folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.cache import ResponseCache
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")          # "b" is now least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_version_mismatch_is_stale():
+    cache = ResponseCache(max_size=4)
+    cache.put("compare", {"nlg": "ok"}, versions={"scenario": "v1"})
+    assert cache.get("compare", versions={"scenario": "v1"}) == {"nlg": "ok"}
+    assert cache.get("compare", versions={"scenario": "v2"}) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["stale"] == 1
+    assert stats["size"] == 0
+
+
+if __name__ == "__main__":
+    test_lru_eviction()
+    test_version_mismatch_is_stale()
+    print("All cache tests passed.")
@@ -0,0 +1,88 @@
+# settings.py
+import os
+
+# -----------------------------
+# Streaming chat responses
+# -----------------------------
+# Rows fetched per round-trip from the DB cursor when streaming a result
+STREAM_BATCH_SIZE = 1000
+# Rows sent per NDJSON line to the client
+STREAM_CHUNK_SIZE = 500
+
+# -----------------------------
+# Paged table answers
+# -----------------------------
+# Rows per page for table answers and /api/chat/page
+CHAT_PAGE_SIZE = 500
+
+# -----------------------------
+# Response encoding
+# -----------------------------
+# Bodies smaller than this are sent uncompressed even if the client accepts gzip
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+
+# -----------------------------
+# parse_query caches
+# -----------------------------
+# Normalized query text -> classified intent
+CLASSIFY_CACHE_SIZE = 1024
+# (intent, constraints) -> full answer, invalidated by data versions
+ANSWER_CACHE_SIZE = 256
+# (intent, row filters) -> row total, invalidated by data versions
+COUNT_CACHE_SIZE = 256
+# Streamed answers with at most this many rows are cached and replayed
+STREAM_CACHE_ROWS = 2000
+
+# -----------------------------
+# Pre-fork server (serve.py)
+# -----------------------------
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 5000
+SERVE_WORKERS = 4
+# Intra-op threads each worker gives torch; workers x threads should not exceed cores
+SERVE_TORCH_THREADS = 1
+# Seconds to wait after forking before printing the per-worker memory report
+SERVE_REPORT_DELAY = 5
+
+# -----------------------------
+# Promotion selection (optimizer/promo_selector.py)
+# -----------------------------
+# CBC time budget in seconds for exact (MILP) selection
+SELECTOR_TIME_LIMIT = 10
+
+# -----------------------------
+# Intent classifier
+# -----------------------------
+# OPTIGUIDE_STUB_CLASSIFIER=1 swaps bart-large-mnli for keyword matching
+# (bot/intents.py) so load tests can measure the non-model path on its own
+STUB_CLASSIFIER = os.environ.get("OPTIGUIDE_STUB_CLASSIFIER") == "1"
+
+# -----------------------------
+# Storage
+# -----------------------------
+# SQLite journal mode set on every connection (default: SQLite's own "delete").
+# "wal" lets long reads (exports, streamed answers) run alongside scenario
+# writes instead of locking them out (OPTIGUIDE_SQLITE_JOURNAL_MODE overrides)
+SQLITE_JOURNAL_MODE = os.environ.get("OPTIGUIDE_SQLITE_JOURNAL_MODE", "delete")
+
+# -----------------------------
+# Scenario export (db/export.py)
+# -----------------------------
+# Rows per cursor fetch and records per streamed chunk
+EXPORT_BATCH_SIZE = 5000
+
+# -----------------------------
+# Scenario diff and lineage (db/scenarios.py)
+# -----------------------------
+# Max added/removed/changed entries listed per diff (counts always cover all)
+DIFF_ENTRY_LIMIT = 1000
+# Scenario id -> flattened overrides through its parent chain, invalidated
+# when the scenario or any ancestor is saved
+SCENARIO_CACHE_SIZE = 32
+
+# -----------------------------
+# Typed assumptions (db/assumptions.py)
+# -----------------------------
+# Scenario id -> parsed finance/supply assumptions, invalidated by data versions
+ASSUMPTION_CACHE_SIZE = 256
@@ -0,0 +1,104 @@
+# assumptions.py
+from sqlalchemy import select, func
+from models import FinanceAssumption, SupplyAssumption
+from bot.cache import ResponseCache
+from db.versions import get_data_versions
+from config.settings import ASSUMPTION_CACHE_SIZE
+
+# Assumption tables by type (finance rows sort before supply rows)
+ASSUMPTION_MODELS = {"finance": FinanceAssumption, "supply": SupplyAssumption}
+ASSUMPTION_TABLES = ["finance_assumption", "supply_assumption"]
+
+_scenario_cache = ResponseCache(ASSUMPTION_CACHE_SIZE)
+
+
+# =============================
+# Filtered queries
+# =============================
+def assumption_types(filters: dict = None) -> list:
+    """Assumption types selected by filters["types"] (all when unset)."""
+    types = (filters or {}).get("types")
+    return [t for t in ASSUMPTION_MODELS if not types or t in types]
+
+
+def assumption_query(model, filters: dict = None):
+    """
+    Typed assumption rows of one table, ordered by id. `scenario_id` and
+    `keys` filters are answered from the (scenario_id, key) index.
+    """
+    filters = filters or {}
+    stmt = (
+        select(model.id, model.scenario_id, model.key, model.value, model.numeric_value, model.unit)
+        .order_by(model.id)
+    )
+    if filters.get("scenario_id") is not None:
+        stmt = stmt.where(model.scenario_id == filters["scenario_id"])
+    if filters.get("keys"):
+        stmt = stmt.where(model.key.in_(filters["keys"]))
+    return stmt
+
+
+def count_assumptions(db, filters: dict = None) -> int:
+    total = 0
+    for kind in assumption_types(filters):
+        total += db.scalar(select(func.count()).select_from(assumption_query(ASSUMPTION_MODELS[kind], filters).subquery()))
+    return total
+
+
+def assumption_row(kind: str, a) -> dict:
+    """
+    Row for one assumption; `value` is the parsed number, or the raw text
+    when it has none.
+    """
+    return {
+        "type": kind,
+        "scenario_id": a.scenario_id,
+        "key": a.key,
+        "value": a.numeric_value if a.numeric_value is not None else a.value,
+        "unit": a.unit
+    }
+
+
+def get_assumptions(db, scenario_id: int = None, keys: list = None, types: list = None) -> list:
+    """
+    Typed assumption rows, optionally filtered by scenario, key and type.
+    """
+    filters = {"scenario_id": scenario_id, "keys": keys, "types": types}
+    rows = []
+    for kind in assumption_types(filters):
+        rows.extend(assumption_row(kind, a) for a in db.execute(assumption_query(ASSUMPTION_MODELS[kind], filters)))
+    return rows
+
+
+# =============================
+# Per-scenario lookups
+# =============================
+def scenario_assumptions(db, scenario_id: int) -> dict:
+    """
+    {(type, key): (number, unit)} for one scenario, cached per process until
+    an assumption table's data version changes. Writers must call
+    bump_data_versions() on the table they change.
+    """
+    versions = get_data_versions(db, ASSUMPTION_TABLES)
+    cached = _scenario_cache.get(scenario_id, versions)
+    if cached is None:
+        cached = {
+            (row["type"], row["key"]): (row["value"], row["unit"])
+            for row in get_assumptions(db, scenario_id=scenario_id)
+        }
+        _scenario_cache.put(scenario_id, cached, versions)
+    return cached
+
+
+def assumption_value(db, scenario_id: int, key: str, kind: str = None, default: float = None):
+    """
+    Numeric value of one assumption in a scenario (`kind` narrows to finance
+    or supply, otherwise finance is checked first), or `default` if it is
+    missing or not numeric.
+    """
+    cached = scenario_assumptions(db, scenario_id)
+    for row_kind in ([kind] if kind else ASSUMPTION_MODELS):
+        value, _ = cached.get((row_kind, key), (None, None))
+        if isinstance(value, float):
+            return value
+    return default
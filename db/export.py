@@ -0,0 +1,122 @@
+# export.py
+import argparse
+import csv
+import io
+import json
+import sys
+from sqlalchemy import select
+from models import SessionLocal, Scenario, ScenarioPromotion, Promotion
+from db.scenarios import scenario_kpis, selection_sources, iter_scenario_overrides, missing_scenarios
+from config.settings import EXPORT_BATCH_SIZE
+
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# One flat CSV layout for every record type; unused columns stay empty
+EXPORT_COLUMNS = [
+    "scenario_id", "record_type",
+    "table_name", "row_id", "column_name", "value",   # override records
+    "promotion_id", "selected",                       # promotion records
+    "revenue", "profit"                               # promotion + kpi records
+]
+
+
+def iter_export_records(db, scenario_ids=None, batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Yield export records for each scenario: its effective overrides
+    (inherited ones included for clones), its selected promotions and one
+    KPI record. Rows are read through server-side
+    cursors (`yield_per`), so memory stays bounded by `batch_size`.
+
+    scenario_ids=None exports every scenario; ids without a scenario are skipped.
+    """
+    if scenario_ids is None:
+        scenario_ids = db.scalars(select(Scenario.scenario_id).order_by(Scenario.scenario_id)).all()
+    else:
+        missing = set(missing_scenarios(db, scenario_ids))
+        scenario_ids = [sid for sid in scenario_ids if sid not in missing]
+
+    for sid in scenario_ids:
+        for o in iter_scenario_overrides(db, sid, batch_size):
+            yield {
+                "scenario_id": sid, "record_type": "override",
+                "table_name": o["table_name"], "row_id": o["row_id"],
+                "column_name": o["column_name"], "value": o["override_value"]
+            }
+
+        source = selection_sources(db, [sid])[sid]
+        promotions = db.execute(
+            select(Promotion.id, Promotion.est_incremental_revenue, Promotion.est_incremental_profit)
+            .join(ScenarioPromotion, ScenarioPromotion.promotion_id == Promotion.id)
+            .where(ScenarioPromotion.scenario_id == source, ScenarioPromotion.selected.is_(True))
+            .order_by(Promotion.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for p in promotions:
+            yield {
+                "scenario_id": sid, "record_type": "promotion",
+                "promotion_id": p.id, "selected": True,
+                "revenue": p.est_incremental_revenue, "profit": p.est_incremental_profit
+            }
+
+        kpi = scenario_kpis(db, [sid])[sid]
+        yield {"scenario_id": sid, "record_type": "kpi", "revenue": kpi["revenue"], "profit": kpi["profit"]}
+
+
+def iter_export_lines(db, scenario_ids=None, fmt: str = "csv", batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Yield the export as text chunks of up to `batch_size` records each
+    (CSV with a header row, or NDJSON).
+    """
+    buf = io.StringIO()
+    if fmt == "csv":
+        writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS, lineterminator="\n")
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        def write(record):
+            buf.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+
+    pending = 0
+    for record in iter_export_records(db, scenario_ids, batch_size):
+        write(record)
+        pending += 1
+        if pending >= batch_size:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+    if buf.tell():
+        yield buf.getvalue()
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main():
+    ap = argparse.ArgumentParser(description="Export scenario overrides, selected promotions and KPIs")
+    ap.add_argument("--scenario", type=int, action="append", dest="scenarios",
+                    help="scenario id to export (repeatable; default: all scenarios)")
+    ap.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    ap.add_argument("--output", help="file to write (default: stdout)")
+    ap.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = ap.parse_args()
+
+    db = SessionLocal()
+    if args.scenarios:
+        missing = missing_scenarios(db, args.scenarios)
+        if missing:
+            db.close()
+            ap.error(f"scenario {missing[0]} not found")
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        for chunk in iter_export_lines(db, args.scenarios, args.format, args.batch_size):
+            out.write(chunk)
+    finally:
+        db.close()
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
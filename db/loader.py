@@ -1,10 +1,13 @@
 # loader.py
 from datetime import datetime
+from sqlalchemy import select
 from models import (
     SessionLocal, Base, engine,
     Scenario, Product, Retailer, Promotion,
     ScenarioPromotion, FinanceAssumption, SupplyAssumption
 )
+from db.versions import ALL_TABLES, bump_data_versions
+from db.scenarios import scenario_version_key
 
 # Initialize DB (create tables)
 def init_db_schema():
@@ -125,6 +128,10 @@ def init_db():
         load_tpo_data(db)
         load_finance_data(db)
         load_supply_data(db)
+        # Invalidate cached chat answers and scenario flattenings in any running app
+        scenario_ids = db.scalars(select(Scenario.scenario_id)).all()
+        bump_data_versions(db, *ALL_TABLES, *map(scenario_version_key, scenario_ids))
+        db.commit()
         print("✅ All domains loaded successfully.")
     finally:
         db.close()
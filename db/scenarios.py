@@ -0,0 +1,325 @@
+# scenarios.py
+from sqlalchemy import select, func, and_, or_, exists, null, union_all, literal
+from sqlalchemy.sql.expression import UnaryExpression
+from sqlalchemy.sql.operators import custom_op
+from models import Promotion, Scenario, ScenarioPromotion, ScenarioOverride, SQLITE_INT_MIN, SQLITE_INT_MAX
+from bot.cache import ResponseCache
+from db.versions import get_data_versions, bump_data_versions
+from config.settings import EXPORT_BATCH_SIZE, DIFF_ENTRY_LIMIT, SCENARIO_CACHE_SIZE
+
+# Scenario id -> flattened overrides, tagged with the versions of its lineage
+_flat_cache = ResponseCache(SCENARIO_CACHE_SIZE)
+
+
+def missing_scenarios(db, scenario_ids) -> list:
+    """The ids in `scenario_ids` that have no scenario row, in request order."""
+    found = set(db.scalars(select(Scenario.scenario_id).where(Scenario.scenario_id.in_(scenario_ids))))
+    return [sid for sid in scenario_ids if sid not in found]
+
+
+# =============================
+# Lineage
+# =============================
+def scenario_version_key(scenario_id: int) -> str:
+    """
+    Data-version key for one scenario's own overrides. Bump it (with
+    bump_data_versions) whenever a scenario is created or its overrides change.
+    """
+    return f"scenario_override:{scenario_id}"
+
+
+def _lineage_cte(scenario_id: int, name: str = "lineage"):
+    """Recursive CTE of (scenario_id, parent_id, depth) from a scenario up to its root."""
+    chain = (
+        select(Scenario.scenario_id, Scenario.parent_id, literal(0).label("depth"))
+        .where(Scenario.scenario_id == scenario_id)
+        .cte(name, recursive=True)
+    )
+    return chain.union_all(
+        select(Scenario.scenario_id, Scenario.parent_id, chain.c.depth + 1)
+        .join(chain, Scenario.scenario_id == chain.c.parent_id)
+    )
+
+
+def scenario_lineage(db, scenario_id: int) -> list:
+    """
+    [scenario_id, parent_id, grandparent_id, ...] up to the root, in one
+    recursive query. Empty if the scenario does not exist.
+    """
+    chain = _lineage_cte(scenario_id)
+    return db.scalars(select(chain.c.scenario_id).order_by(chain.c.depth)).all()
+
+
+# =============================
+# Effective overrides
+# =============================
+def effective_override_query(scenario_id: int, name: str = "lineage"):
+    """
+    A clone's effective override rows: for each cell, the row from the
+    nearest scenario in its lineage (its own rows win). `name` names the
+    lineage CTE, so two of these can share one statement.
+
+    Resolved in SQL with one sort over every override in the lineage, so a
+    deep clone costs about the same as a flat scenario with the same rows.
+    """
+    chain = _lineage_cte(scenario_id, name)
+    key = (ScenarioOverride.table_name, ScenarioOverride.row_id, ScenarioOverride.column_name)
+    ranked = (
+        select(*key, ScenarioOverride.id, ScenarioOverride.override_value,
+               func.row_number().over(partition_by=key, order_by=chain.c.depth).label("rank"))
+        .join(chain, ScenarioOverride.scenario_id == chain.c.scenario_id)
+        .subquery()
+    )
+    return (
+        select(ranked.c.id, ranked.c.table_name, ranked.c.row_id, ranked.c.column_name, ranked.c.override_value)
+        .where(ranked.c.rank == 1)
+    )
+
+
+def iter_scenario_overrides(db, scenario_id: int, batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Yield a scenario's effective override rows from a server-side cursor,
+    so memory stays bounded by `batch_size` whatever the scenario size.
+    Root scenarios skip lineage resolution and read their own rows.
+    """
+    if len(scenario_lineage(db, scenario_id)) > 1:
+        stmt = effective_override_query(scenario_id)
+    else:
+        stmt = (
+            select(ScenarioOverride.id, ScenarioOverride.table_name, ScenarioOverride.row_id,
+                   ScenarioOverride.column_name, ScenarioOverride.override_value)
+            .where(ScenarioOverride.scenario_id == scenario_id)
+        )
+    for r in db.execute(stmt.execution_options(yield_per=batch_size)):
+        yield r._asdict()
+
+
+def effective_overrides(db, scenario_id: int, lineage: list = None) -> dict:
+    """
+    Overrides in effect for a scenario as {(table_name, row_id, column_name):
+    override row dict}. The dict is shared with the cache and must not be
+    modified.
+
+    Only the requested scenario is cached, tagged with the version keys of
+    its whole lineage, so a save anywhere up the chain invalidates it.
+    """
+    lineage = lineage if lineage is not None else scenario_lineage(db, scenario_id)
+    versions = get_data_versions(db, [scenario_version_key(s) for s in lineage])
+    flat = _flat_cache.get(scenario_id, versions)
+    if flat is None:
+        flat = {(r["table_name"], r["row_id"], r["column_name"]): r for r in iter_scenario_overrides(db, scenario_id)}
+        _flat_cache.put(scenario_id, flat, versions)
+    return flat
+
+
+def _override_row_id(value) -> int:
+    """
+    A change's row_id as an int, so "1" and 1 name the same cell. Raises
+    ValueError for anything that is not an integer in SQLite's range.
+    """
+    if isinstance(value, str) and value.strip().lstrip("+-").isdigit():
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool) or not SQLITE_INT_MIN <= value <= SQLITE_INT_MAX:
+        raise ValueError(f"Invalid row_id: {value!r}")
+    return value
+
+
+def save_overrides(db, scenario, changes: list) -> int:
+    """
+    Replace a scenario's own overrides with `changes`, in the caller's
+    transaction, and bump its version key. Returns the number of rows stored.
+
+    Each change is {"table", "row_id", "column", "new_value"} (rows echoed
+    from hydration, spelled table_name/column_name/override_value, are also
+    accepted); a later change to the same cell wins. Raises ValueError,
+    before anything is written, if a change is not a dict naming a table,
+    an integer row_id and a column.
+
+    Clones store only their delta: a change that echoes an inherited
+    override unchanged (same "id" and value) is dropped. An explicit edit
+    has no id and is always stored, even when it equals the inherited value,
+    so the clone keeps it if the parent changes later.
+    """
+    if not isinstance(changes, list):
+        raise ValueError("changes must be a list")
+    latest = {}
+    for c in changes:
+        if not isinstance(c, dict):
+            raise ValueError(f"Invalid change: {c!r}")
+        table = c.get("table", c.get("table_name"))
+        column = c.get("column", c.get("column_name"))
+        if not isinstance(table, str) or not isinstance(column, str):
+            raise ValueError(f"Change needs 'table' and 'column': {c!r}")
+        value = str(c.get("new_value", c.get("override_value")))
+        latest[(table, _override_row_id(c.get("row_id")), column)] = (c.get("id"), value)
+
+    if scenario.parent_id:
+        inherited = effective_overrides(db, scenario.parent_id)
+        latest = {
+            key: (override_id, value) for key, (override_id, value) in latest.items()
+            if override_id is None or key not in inherited
+            or (inherited[key]["id"], inherited[key]["override_value"]) != (override_id, value)
+        }
+
+    db.query(ScenarioOverride).filter_by(scenario_id=scenario.scenario_id).delete()
+    db.add_all(
+        ScenarioOverride(scenario_id=scenario.scenario_id, table_name=table, row_id=row_id,
+                         column_name=column, override_value=value)
+        for (table, row_id, column), (_, value) in latest.items()
+    )
+    bump_data_versions(db, "scenario_override", scenario_version_key(scenario.scenario_id))
+    return len(latest)
+
+
+# =============================
+# KPIs
+# =============================
+def selection_sources(db, scenario_ids) -> dict:
+    """
+    scenario_id -> the scenario whose promotion selection applies to it:
+    the nearest scenario in its lineage that owns its selection (see
+    Scenario.owns_selection), or the root. Clones inherit the parent's
+    selection until one is saved for them.
+    """
+    scenario_ids = list(scenario_ids)
+    sources = {sid: sid for sid in scenario_ids}
+    if not scenario_ids:
+        return sources
+
+    # Every requested scenario walks up its own lineage in one recursive query
+    chain = (
+        select(Scenario.scenario_id.label("origin"), Scenario.scenario_id, Scenario.parent_id,
+               Scenario.owns_selection, literal(0).label("depth"))
+        .where(Scenario.scenario_id.in_(scenario_ids))
+        .cte("selection_chain", recursive=True)
+    )
+    chain = chain.union_all(
+        select(chain.c.origin, Scenario.scenario_id, Scenario.parent_id, Scenario.owns_selection, chain.c.depth + 1)
+        .join(chain, Scenario.scenario_id == chain.c.parent_id)
+    )
+    rows = db.execute(
+        select(chain.c.origin, chain.c.scenario_id)
+        .where(or_(chain.c.owns_selection.is_(True), chain.c.parent_id.is_(None)))
+        .order_by(chain.c.origin, chain.c.depth.desc())
+    )
+    # Deepest first, so the nearest owner is written last
+    for origin, sid in rows:
+        sources[origin] = sid
+    return sources
+
+
+def scenario_kpis(db, scenario_ids) -> dict:
+    """
+    Revenue/profit totals of each scenario's selected promotions (inherited
+    from the nearest ancestor for clones), computed with one GROUP BY.
+    Scenarios without selected promotions get zeros.
+
+    Returns:
+        dict: scenario_id -> {"revenue", "profit", "promotions"}
+    """
+    sources = selection_sources(db, scenario_ids)
+    kpis = {sid: {"revenue": 0, "profit": 0, "promotions": 0} for sid in sources}
+    if not sources:
+        return kpis
+
+    rows = db.execute(
+        select(
+            ScenarioPromotion.scenario_id,
+            func.coalesce(func.sum(Promotion.est_incremental_revenue), 0),
+            func.coalesce(func.sum(Promotion.est_incremental_profit), 0),
+            func.count(Promotion.id)
+        )
+        .join(Promotion, ScenarioPromotion.promotion_id == Promotion.id)
+        .where(ScenarioPromotion.scenario_id.in_(set(sources.values())), ScenarioPromotion.selected.is_(True))
+        .group_by(ScenarioPromotion.scenario_id)
+    )
+    totals = {sid: {"revenue": revenue, "profit": profit, "promotions": count} for sid, revenue, profit, count in rows}
+    for sid, source in sources.items():
+        if source in totals:
+            kpis[sid] = dict(totals[source])
+    return kpis
+
+
+# =============================
+# Diff
+# =============================
+def _override_side(scenario_id: int, lineage: list, side: str):
+    """
+    (table_name, row_id, column_name, override_value) rows in effect for one
+    side of a diff: a root's own rows, or a clone's lineage-resolved rows
+    from effective_override_query(), materialized once for both joins.
+    """
+    if len(lineage) > 1:
+        return effective_override_query(scenario_id, f"{side}_lineage").cte(f"{side}_effective").prefix_with("MATERIALIZED")
+    return (
+        select(ScenarioOverride.table_name, ScenarioOverride.row_id,
+               ScenarioOverride.column_name, ScenarioOverride.override_value)
+        .where(ScenarioOverride.scenario_id == scenario_id)
+        .subquery()
+    )
+
+
+def diff_overrides(db, base_id, other_id, limit: int = DIFF_ENTRY_LIMIT, batch_size: int = EXPORT_BATCH_SIZE) -> dict:
+    """
+    Added (only in other), removed (only in base) and changed overrides
+    between two scenarios, each listed up to `limit`, with full counts.
+    Clones are compared on their effective (inherited) overrides.
+
+    One UNION ALL of two anti/outer joins on the override key, so only
+    differing rows ever reach Python. Root sides are answered from the
+    covering ix_scenario_override_key; a clone side is resolved once by
+    effective_override_query() and joined through an automatic index.
+    """
+    a = _override_side(base_id, scenario_lineage(db, base_id), "base").alias("base_side")
+    b = _override_side(other_id, scenario_lineage(db, other_id), "other").alias("other_side")
+    same_key = and_(a.c.table_name == b.c.table_name, a.c.row_id == b.c.row_id, a.c.column_name == b.c.column_name)
+    # Given all four key columns SQLite probes the UNIQUE index and then reads
+    # each row for override_value; a unary + on one term keeps that index out
+    # so the probe stays in the covering index
+    covered_key = and_(a.c.table_name == b.c.table_name, a.c.row_id == b.c.row_id,
+                       a.c.column_name == UnaryExpression(b.c.column_name, operator=custom_op("+")))
+
+    removed_or_changed = (
+        select(a.c.table_name, a.c.row_id, a.c.column_name,
+               a.c.override_value.label("base_value"), b.c.override_value.label("other_value"))
+        .outerjoin(b, covered_key)
+        .where(or_(b.c.override_value.is_(None), b.c.override_value != a.c.override_value))
+    )
+    added = (
+        select(b.c.table_name, b.c.row_id, b.c.column_name,
+               null().label("base_value"), b.c.override_value.label("other_value"))
+        .where(~exists().where(same_key))
+    )
+
+    entries = {"added": [], "removed": [], "changed": []}
+    counts = dict.fromkeys(entries, 0)
+    rows = db.execute(union_all(removed_or_changed, added).execution_options(yield_per=batch_size))
+    for table_name, row_id, column_name, base_value, other_value in rows:
+        # override_value is NOT NULL, so a NULL side means the key is missing there
+        if base_value is None:
+            kind, values = "added", {"value": other_value}
+        elif other_value is None:
+            kind, values = "removed", {"value": base_value}
+        else:
+            kind, values = "changed", {"base_value": base_value, "other_value": other_value}
+        counts[kind] += 1
+        if counts[kind] <= limit:
+            entries[kind].append({"table_name": table_name, "row_id": row_id, "column_name": column_name, **values})
+
+    return {**entries, "counts": counts, "truncated": any(n > limit for n in counts.values())}
+
+
+def diff_scenarios(db, base_id, other_id, limit: int = DIFF_ENTRY_LIMIT) -> dict:
+    """
+    Override diff between two scenarios (inherited overrides included) plus
+    the revenue/profit deltas (other - base) of their selected promotions.
+    """
+    diff = diff_overrides(db, base_id, other_id, limit)
+    kpis = scenario_kpis(db, [base_id, other_id])
+    base, other = kpis[base_id], kpis[other_id]
+    diff["kpis"] = {
+        "base": base,
+        "other": other,
+        "delta": {k: other[k] - base[k] for k in ("revenue", "profit", "promotions")}
+    }
+    return diff
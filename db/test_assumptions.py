@@ -0,0 +1,78 @@
+import sys
+import os
+
+# Ensure imports work when running from db folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Scenario, FinanceAssumption, SupplyAssumption, parse_assumption_value
+from db import assumptions
+from db.assumptions import get_assumptions, count_assumptions, assumption_value
+from db.versions import bump_data_versions
+
+
+def test_parse_assumption_value():
+    assert parse_assumption_value('{"value":0.12}') == (0.12, None)
+    assert parse_assumption_value('{"days":14}') == (14.0, "days")
+    assert parse_assumption_value("250") == (250.0, None)
+    assert parse_assumption_value('{"mode":"strict"}') == (None, None)
+    assert parse_assumption_value("not json") == (None, None)
+
+
+def test_value_parsed_on_write():
+    a = FinanceAssumption(scenario_id=1, key="lead_time", value='{"days":14}')
+    assert (a.numeric_value, a.unit) == (14.0, "days")
+    a.value = '{"value":0.2}'
+    assert (a.numeric_value, a.unit) == (0.2, None)
+
+
+@pytest.fixture
+def db():
+    # Fresh in-memory database per test
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        Scenario(scenario_id=1, name="AOP", type="finance"),
+        Scenario(scenario_id=2, name="Stress", type="supply"),
+        FinanceAssumption(scenario_id=1, key="roi_target", value='{"value":0.12}'),
+        FinanceAssumption(scenario_id=1, key="capex_limit", value='{"value":100000}'),
+        SupplyAssumption(scenario_id=2, key="lead_time", value='{"days":14}'),
+        SupplyAssumption(scenario_id=1, key="lead_time", value='{"days":7}'),
+    ])
+    session.commit()
+    assumptions._scenario_cache.clear()
+    yield session
+    session.close()
+
+
+def test_filtered_lookup(db):
+    assert len(get_assumptions(db)) == 4
+    assert [a["key"] for a in get_assumptions(db, scenario_id=1, types=["finance"])] == ["roi_target", "capex_limit"]
+    lead_times = get_assumptions(db, keys=["lead_time"])
+    assert [(a["type"], a["scenario_id"], a["value"], a["unit"]) for a in lead_times] == [
+        ("supply", 2, 14.0, "days"), ("supply", 1, 7.0, "days")
+    ]
+    assert count_assumptions(db, {"scenario_id": 1, "keys": ["lead_time", "roi_target"]}) == 2
+
+
+def test_assumption_value_by_kind(db):
+    assert assumption_value(db, 1, "lead_time") == 7.0
+    assert assumption_value(db, 1, "lead_time", kind="supply") == 7.0
+    assert assumption_value(db, 1, "lead_time", kind="finance", default=-1) == -1
+
+
+def test_scenario_cache_invalidation(db):
+    assert assumption_value(db, 1, "roi_target") == 0.12
+    assert assumption_value(db, 1, "missing", default=-1) == -1
+
+    db.query(FinanceAssumption).filter_by(scenario_id=1, key="roi_target").one().value = '{"value":0.2}'
+    db.commit()
+    # Writers that skip the version bump keep being served the cached value
+    assert assumption_value(db, 1, "roi_target") == 0.12
+
+    bump_data_versions(db, "finance_assumption")
+    db.commit()
+    assert assumption_value(db, 1, "roi_target") == 0.2
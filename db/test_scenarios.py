@@ -0,0 +1,142 @@
+import sys
+import os
+
+# Ensure imports work when running from db folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Promotion, Scenario, ScenarioOverride
+from db import scenarios
+from db.scenarios import diff_overrides, effective_overrides, iter_scenario_overrides, save_overrides, scenario_kpis
+from optimizer.promo_selector import save_selection
+
+
+@pytest.fixture
+def db():
+    # Fresh in-memory database per test: root <- child <- grandchild
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        Scenario(scenario_id=1, name="root", type="tpo"),
+        Scenario(scenario_id=2, name="child", type="tpo", parent_id=1),
+        Scenario(scenario_id=3, name="grandchild", type="tpo", parent_id=2),
+    ])
+    session.flush()
+    save_overrides(session, session.get(Scenario, 1), [edit(1, "0.1"), edit(2, "0.2")])
+    save_overrides(session, session.get(Scenario, 2), [edit(2, "0.25")])
+    save_overrides(session, session.get(Scenario, 3), [edit(3, "0.3")])
+    session.commit()
+    scenarios._flat_cache.clear()
+    yield session
+    session.close()
+
+
+def edit(row_id: int, value: str) -> dict:
+    return {"table": "promotion", "row_id": row_id, "column": "discount_depth", "new_value": value}
+
+
+def values(db, scenario_id: int) -> dict:
+    return {key[1]: row["override_value"] for key, row in effective_overrides(db, scenario_id).items()}
+
+
+def overrides(values: dict) -> dict:
+    return {
+        ("promotion", row_id, "discount_depth"): {"override_value": value}
+        for row_id, value in values.items()
+    }
+
+
+def test_diff_overrides_between_roots(db):
+    db.add(Scenario(scenario_id=4, name="other root", type="tpo"))
+    db.flush()
+    save_overrides(db, db.get(Scenario, 1), [edit(1, "0.1"), edit(2, "0.2"), edit(6, "0.6")])
+    save_overrides(db, db.get(Scenario, 4), [edit(2, "0.22"), edit(3, "0.3"), edit(5, "0.5"), edit(6, "0.6")])
+    db.commit()
+
+    diff = diff_overrides(db, 1, 4, limit=10)
+    assert diff["counts"] == {"added": 2, "removed": 1, "changed": 1}
+    assert sorted(e["row_id"] for e in diff["added"]) == [3, 5]
+    assert diff["removed"] == [{"table_name": "promotion", "row_id": 1, "column_name": "discount_depth", "value": "0.1"}]
+    assert diff["changed"] == [{"table_name": "promotion", "row_id": 2, "column_name": "discount_depth",
+                                "base_value": "0.2", "other_value": "0.22"}]
+    assert not diff["truncated"]
+
+    limited = diff_overrides(db, 1, 4, limit=1)
+    assert limited["counts"] == diff["counts"]
+    assert len(limited["added"]) == 1 and limited["truncated"]
+    assert diff_overrides(db, 4, 4, limit=10)["counts"] == {"added": 0, "removed": 0, "changed": 0}
+
+
+def test_diff_overrides_resolves_clones(db):
+    # Effective: 1 -> {1: 0.1, 2: 0.2}, 2 -> {1: 0.1, 2: 0.25}, 3 -> {1: 0.1, 2: 0.25, 3: 0.3}
+    diff = diff_overrides(db, 1, 3, limit=10)
+    assert diff["counts"] == {"added": 1, "removed": 0, "changed": 1}
+    assert diff["changed"][0]["row_id"] == 2 and diff["changed"][0]["other_value"] == "0.25"
+    assert diff["added"][0]["row_id"] == 3
+
+    reverse = diff_overrides(db, 3, 2, limit=0)
+    assert reverse["counts"] == {"added": 0, "removed": 1, "changed": 0}
+    assert reverse["removed"] == [] and reverse["truncated"]
+    assert diff_overrides(db, 3, 3)["counts"] == {"added": 0, "removed": 0, "changed": 0}
+
+
+def test_lineage_resolution_child_wins(db):
+    assert values(db, 3) == {1: "0.1", 2: "0.25", 3: "0.3"}
+    streamed = {r["row_id"]: r["override_value"] for r in iter_scenario_overrides(db, 3)}
+    assert streamed == values(db, 3)
+
+
+def test_ancestor_save_invalidates_descendants(db):
+    assert values(db, 3)[1] == "0.1"
+    save_overrides(db, db.get(Scenario, 1), [edit(1, "0.05"), edit(2, "0.2")])
+    db.commit()
+    assert values(db, 3)[1] == "0.05"
+
+
+def test_clone_saves_only_its_delta(db):
+    echo = dict(effective_overrides(db, 1)[("promotion", 2, "discount_depth")])   # hydrated row sent back unchanged
+    stored = save_overrides(db, db.get(Scenario, 2), [echo, edit(1, "0.1"), edit(4, "0.4")])
+    db.commit()
+    # The echo is dropped; the explicit edit of row 1 is kept even though it
+    # equals the parent's value, so a later parent edit does not override it
+    assert stored == 2
+    assert sorted(o.row_id for o in db.query(ScenarioOverride).filter_by(scenario_id=2)) == [1, 4]
+    assert values(db, 2) == {1: "0.1", 2: "0.2", 4: "0.4"}
+
+    save_overrides(db, db.get(Scenario, 1), [edit(1, "0.05"), edit(2, "0.2")])
+    db.commit()
+    assert values(db, 2)[1] == "0.1"
+
+
+def test_row_ids_are_coerced_to_one_cell(db):
+    stored = save_overrides(db, db.get(Scenario, 1), [edit("1", "0.1"), edit(1, "0.15")])
+    db.commit()
+    assert stored == 1
+    assert values(db, 1) == {1: "0.15"}
+    for bad in ("x", 1.5, None, 2 ** 63):
+        with pytest.raises(ValueError):
+            save_overrides(db, db.get(Scenario, 1), [edit(bad, "0.1")])
+
+
+def test_empty_selection_stops_inheritance(db):
+    db.add_all([
+        Promotion(id=1, est_incremental_revenue=5000.0, est_incremental_profit=2000.0),
+        Promotion(id=2, est_incremental_revenue=1000.0, est_incremental_profit=400.0),
+    ])
+    save_selection(db, 1, [1])
+    db.commit()
+    assert scenario_kpis(db, [2, 3])[3]["revenue"] == 5000.0
+
+    # An optimize run that selects nothing still gives the clone its own selection
+    save_selection(db, 2, [])
+    db.commit()
+    kpis = scenario_kpis(db, [1, 2, 3])
+    assert kpis[1]["revenue"] == 5000.0
+    assert kpis[2] == kpis[3] == {"revenue": 0, "profit": 0, "promotions": 0}
+
+    save_selection(db, 3, [2])
+    db.commit()
+    assert scenario_kpis(db, [3])[3]["profit"] == 400.0
@@ -0,0 +1,36 @@
+# versions.py
+from uuid import uuid4
+from sqlalchemy import select
+from models import DataVersion
+
+# Every table whose contents can feed a chat answer
+ALL_TABLES = [
+    "scenario", "scenario_override", "scenario_promotion",
+    "finance_assumption", "supply_assumption",
+    "product", "retailer", "promotion"
+]
+
+
+def get_data_versions(db, tables) -> dict:
+    """
+    Current version token for each table (None if the table was never written
+    through bump_data_versions).
+    """
+    tables = sorted(set(tables))
+    if not tables:
+        return {}
+    rows = db.execute(
+        select(DataVersion.table_name, DataVersion.version).where(DataVersion.table_name.in_(tables))
+    )
+    versions = dict.fromkeys(tables)
+    versions.update({r.table_name: r.version for r in rows})
+    return versions
+
+
+def bump_data_versions(db, *tables):
+    """
+    Give each table a fresh random version token, in the caller's transaction.
+    Random tokens (not counters) stay unique across DB resets by the loader.
+    """
+    for table in tables:
+        db.merge(DataVersion(table_name=table, version=uuid4().hex))
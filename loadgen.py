@@ -0,0 +1,362 @@
+# loadgen.py
+"""
+Local load generator for the chat app.
+
+Replays a corpus of chat queries plus scenario save/load/list calls against
+a running app and reports throughput, p50/p95/p99 latency and error rate per
+route.
+
+    # against an already running app
+    python3 loadgen.py --url http://127.0.0.1:5000 --concurrency 50 --duration 30
+
+    # start serve.py itself (stub classifier, 4 workers, WAL) and save the report
+    python3 loadgen.py --spawn-server --workers 4 --stub-classifier \\
+        --journal-mode wal --rate 200 --concurrency 500 --json runs/w4-wal.json
+
+    # compare saved runs side by side
+    python3 loadgen.py --compare runs/w2.json runs/w4-wal.json
+
+Without --rate the generator is closed-loop (each of --concurrency users
+sends its next request when the previous one returns). With --rate requests
+arrive on a Poisson schedule and latency is measured from the scheduled
+arrival, so queueing inside the generator is not hidden.
+
+Save calls create scenarios named "loadgen-..." in the target database.
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from config.settings import SQLITE_JOURNAL_MODE
+
+DEFAULT_QUERIES = [
+    "list promotions",
+    "list promotions at walmart",
+    "summarize promotion impact",
+    "compare scenarios",
+    "show assumptions",
+    "what if promotion 1 discount 10%",
+    "optimize promotions under 2M budget",
+    "optimize promotions with max discount 20% and roi > 1.5x",
+]
+
+# Default share of each operation in the request mix
+DEFAULT_MIX = "chat=70,list=10,load=10,save=10"
+
+# -----------------------------
+# Operations
+# -----------------------------
+_local = threading.local()
+
+
+def http():
+    """One requests.Session (cookie jar + keep-alive) per worker thread."""
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+# Route each operation requests, known before it is sent so that timeouts
+# and connection errors are reported under the route too
+OP_ROUTES = {
+    "chat": "/api/chat",
+    "list": "/api/scenario/list",
+    "load": "/api/scenario/load",
+    "save": "/api/scenario/save",
+}
+
+
+class Target:
+    def __init__(self, url: str, queries: list, stream: bool, timeout: float):
+        self.url = url.rstrip("/")
+        self.queries = queries
+        self.stream = stream
+        self.timeout = timeout
+        self.scenario_ids = [1]
+        self.lock = threading.Lock()
+
+    def chat(self):
+        headers = {"Accept": "application/x-ndjson"} if self.stream else {}
+        query = random.choice(self.queries)
+        return http().post(
+            f"{self.url}/api/chat", json={"query": query}, headers=headers, timeout=self.timeout
+        )
+
+    def list(self):
+        resp = http().get(f"{self.url}/api/scenario/list", timeout=self.timeout)
+        if resp.ok:
+            ids = [s["id"] for s in resp.json().get("scenarios", [])]
+            if ids:
+                with self.lock:
+                    self.scenario_ids = ids
+        return resp
+
+    def load(self):
+        with self.lock:
+            scenario_id = random.choice(self.scenario_ids)
+        return http().post(
+            f"{self.url}/api/scenario/load", json={"scenario_id": scenario_id}, timeout=self.timeout
+        )
+
+    def save(self):
+        changes = [
+            {"table": "promotion", "row_id": random.randint(1, 2), "column": "discount_depth",
+             "new_value": round(random.uniform(0.05, 0.3), 2)}
+            for _ in range(random.randint(1, 5))
+        ]
+        return http().post(
+            f"{self.url}/api/scenario/save",
+            json={"scenario_name": f"loadgen-{uuid.uuid4().hex[:8]}", "changes": changes},
+            timeout=self.timeout
+        )
+
+
+def parse_mix(mix: str) -> list:
+    """"chat=70,save=10" -> [("chat", 70.0), ("save", 10.0)]"""
+    ops = []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OP_ROUTES:
+            raise ValueError(f"Unknown operation in --mix: {name}")
+        ops.append((name.strip(), float(weight or 1)))
+    return ops
+
+# -----------------------------
+# Recording
+# -----------------------------
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)   # route -> [seconds]
+        self.errors = defaultdict(int)       # route -> count
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, route: str, latency: float, ok: bool):
+        with self.lock:
+            self.latencies[route].append(latency)
+            if not ok:
+                self.errors[route] += 1
+
+
+def run_op(target: Target, op: str, recorder: Recorder, scheduled: float = None):
+    start = scheduled if scheduled is not None else time.perf_counter()
+    ok = False
+    try:
+        resp = getattr(target, op)()
+        _ = resp.content   # read the full (possibly streamed) body
+        ok = resp.ok
+    except Exception:
+        # Timeouts, connection errors and bad responses all count as errors
+        # of the route; never let one end a closed-loop user thread
+        pass
+    recorder.record(OP_ROUTES[op], time.perf_counter() - start, ok)
+
+
+def run_load(target: Target, mix: list, concurrency: int, duration: float,
+             max_requests: int, rate: float) -> Recorder:
+    recorder = Recorder()
+    ops, weights = zip(*mix)
+    deadline = time.perf_counter() + duration
+    sent = 0
+
+    def keep_going():
+        return time.perf_counter() < deadline and (not max_requests or sent < max_requests)
+
+    if rate:
+        # Open loop: Poisson arrivals, bounded by `concurrency` in flight
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            next_at = time.perf_counter()
+            while keep_going():
+                next_at += random.expovariate(rate)
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(run_op, target, random.choices(ops, weights)[0], recorder, next_at)
+                sent += 1
+    else:
+        # Closed loop: `concurrency` users, each waiting for its own response
+        counter = threading.Lock()
+
+        def user():
+            nonlocal sent
+            while True:
+                with counter:
+                    if not keep_going():
+                        return
+                    sent += 1
+                run_op(target, random.choices(ops, weights)[0], recorder)
+
+        threads = [threading.Thread(target=user, daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    recorder.finished = time.perf_counter()
+    return recorder
+
+# -----------------------------
+# Reporting
+# -----------------------------
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(recorder: Recorder, label: str, settings: dict) -> dict:
+    elapsed = recorder.finished - recorder.started
+    routes = {}
+    all_latencies = []
+    for route, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        all_latencies.extend(values)
+        routes[route] = {
+            "requests": len(values),
+            "errors": recorder.errors[route],
+            "error_rate": round(recorder.errors[route] / len(values), 4),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+        }
+    all_latencies.sort()
+    total_errors = sum(recorder.errors.values())
+    routes["all"] = {
+        "requests": len(all_latencies),
+        "errors": total_errors,
+        "error_rate": round(total_errors / len(all_latencies), 4) if all_latencies else 0.0,
+        "throughput_rps": round(len(all_latencies) / elapsed, 2),
+        "p50_ms": round(percentile(all_latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(all_latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(all_latencies, 99) * 1000, 1),
+    }
+    return {"label": label, "settings": settings, "elapsed_s": round(elapsed, 2), "routes": routes}
+
+
+COLUMNS = ["requests", "errors", "error_rate", "throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+
+
+def print_report(report: dict):
+    print(f"\n== {report['label']} ({report['elapsed_s']}s) {report['settings']}")
+    print(f"{'route':<24}" + "".join(f"{c:>15}" for c in COLUMNS))
+    for route, stats in report["routes"].items():
+        print(f"{route:<24}" + "".join(f"{stats[c]:>15}" for c in COLUMNS))
+
+
+def print_comparison(reports: list):
+    """One row per route and run, grouped by route."""
+    routes = sorted({r for report in reports for r in report["routes"]}, key=lambda r: (r == "all", r))
+    print(f"{'route':<24}{'run':<20}" + "".join(f"{c:>15}" for c in COLUMNS))
+    for route in routes:
+        for report in reports:
+            stats = report["routes"].get(route)
+            if stats:
+                print(f"{route:<24}{report['label'][:19]:<20}" + "".join(f"{stats[c]:>15}" for c in COLUMNS))
+
+# -----------------------------
+# Optional server under test
+# -----------------------------
+def spawn_server(args):
+    env = dict(os.environ)
+    if args.stub_classifier:
+        env["OPTIGUIDE_STUB_CLASSIFIER"] = "1"
+    if args.journal_mode:
+        env["OPTIGUIDE_SQLITE_JOURNAL_MODE"] = args.journal_mode
+    port = args.url.rsplit(":", 1)[-1].strip("/")
+    log = open(args.server_log, "a")
+    proc = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(args.workers), "--port", port],
+        env=env, stdout=log, stderr=log
+    )
+    log.close()
+    for _ in range(600):
+        try:
+            requests.get(f"{args.url}/api/scenario/list", timeout=1)
+            return proc
+        except requests.RequestException:
+            if proc.poll() is not None:
+                raise RuntimeError(f"serve.py exited during startup (see {args.server_log})")
+            time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("serve.py did not come up in time")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load generator for the OptiGuide chat API")
+    ap.add_argument("--url", default="http://127.0.0.1:5000")
+    ap.add_argument("--concurrency", type=int, default=50, help="users (closed loop) or max in flight (open loop)")
+    ap.add_argument("--rate", type=float, help="arrivals per second; enables open-loop mode")
+    ap.add_argument("--duration", type=float, default=30, help="seconds to run")
+    ap.add_argument("--requests", type=int, default=0, help="stop after this many requests (0 = no limit)")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights (default {DEFAULT_MIX})")
+    ap.add_argument("--corpus", help="file with one chat query per line (default: built-in queries)")
+    ap.add_argument("--stream", action="store_true", help="request NDJSON-streamed chat answers")
+    ap.add_argument("--timeout", type=float, default=60)
+    ap.add_argument("--label", help="name for this run in reports")
+    ap.add_argument("--json", help="write the report to this file")
+    ap.add_argument("--compare", nargs="+", metavar="REPORT", help="print saved reports side by side and exit")
+    ap.add_argument("--spawn-server", action="store_true", help="start serve.py for the run")
+    ap.add_argument("--workers", type=int, default=4, help="serve.py workers with --spawn-server")
+    ap.add_argument("--stub-classifier", action="store_true", help="keyword classifier instead of the model (--spawn-server)")
+    ap.add_argument("--journal-mode", help="SQLite journal mode for --spawn-server, e.g. wal")
+    ap.add_argument("--server-log", default=os.devnull, help="file for serve.py output with --spawn-server")
+    args = ap.parse_args()
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path) as f:
+                reports.append(json.load(f))
+        print_comparison(reports)
+        return
+
+    queries = DEFAULT_QUERIES
+    if args.corpus:
+        with open(args.corpus) as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    settings = {
+        "concurrency": args.concurrency, "rate": args.rate, "mix": args.mix, "stream": args.stream
+    }
+    if args.spawn_server:
+        settings.update({
+            "workers": args.workers, "stub_classifier": args.stub_classifier,
+            "journal_mode": args.journal_mode or SQLITE_JOURNAL_MODE
+        })
+
+    server = spawn_server(args) if args.spawn_server else None
+    try:
+        target = Target(args.url, queries, args.stream, args.timeout)
+        recorder = run_load(
+            target, parse_mix(args.mix), args.concurrency, args.duration, args.requests, args.rate
+        )
+    finally:
+        if server:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+    label = args.label or (os.path.splitext(os.path.basename(args.json))[0] if args.json else "run")
+    report = summarize(recorder, label, settings)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
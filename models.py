@@ -1,6 +1,8 @@
+import json
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Float
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy import create_engine, event, Column, Index, UniqueConstraint, Integer, String, Text, DateTime, ForeignKey, Boolean, Float
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker, validates
+from config.settings import SQLITE_JOURNAL_MODE
 
 # -------------------------
 # Database setup
@@ -10,8 +12,17 @@ DATABASE_URL = "sqlite:///db/optiguide.db"
 engine = create_engine(DATABASE_URL, echo=False, future=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.close()
+
 Base = declarative_base()
 
+# Range of an SQLite INTEGER; larger Python ints fail on bind with OverflowError
+SQLITE_INT_MIN, SQLITE_INT_MAX = -2 ** 63, 2 ** 63 - 1
+
 # =========================
 # Core Scenario
 # =========================
@@ -22,6 +33,11 @@ class Scenario(Base):
     description = Column(Text)
     type = Column(String, nullable=False)  # e.g., tpo, finance, supply
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Clones store only their own overrides and inherit the rest from the parent
+    parent_id = Column(Integer, ForeignKey("scenario.scenario_id", ondelete="SET NULL"), index=True)
+    # Set once the scenario stores its own promotion selection (even an empty
+    # one); until then a clone uses its parent's. Roots always use their own.
+    owns_selection = Column(Boolean, default=False, nullable=False)
 
     overrides = relationship("ScenarioOverride", back_populates="scenario", cascade="all, delete-orphan")
     tpo_promotions = relationship("ScenarioPromotion", back_populates="scenario", cascade="all, delete-orphan")
@@ -42,19 +58,51 @@ class ScenarioOverride(Base):
 
     scenario = relationship("Scenario", back_populates="overrides")
 
+    # One override per cell within a scenario. The covering index repeats the
+    # key with override_value so diffs (db.scenarios.diff_overrides) join
+    # without reading the table: about twice as fast on 300k overrides, for
+    # about twice the insert time on each bulk save. Diffs read whole
+    # scenarios while saves mostly write clone deltas, so both are kept.
+    __table_args__ = (
+        UniqueConstraint("scenario_id", "table_name", "row_id", "column_name", name="uq_scenario_override_key"),
+        Index("ix_scenario_override_key", "scenario_id", "table_name", "row_id", "column_name", "override_value"),
+    )
+
 # -------------------------
 # TPO Promotion mapping
 # -------------------------
 class ScenarioPromotion(Base):
     __tablename__ = "scenario_promotion"
     id = Column(Integer, primary_key=True)
-    scenario_id = Column(Integer, ForeignKey("scenario.scenario_id", ondelete="CASCADE"), nullable=False)
+    scenario_id = Column(Integer, ForeignKey("scenario.scenario_id", ondelete="CASCADE"), nullable=False, index=True)
     promotion_id = Column(Integer, ForeignKey("promotion.id", ondelete="CASCADE"), nullable=False)
     selected = Column(Boolean, default=False)
 
     scenario = relationship("Scenario", back_populates="tpo_promotions")
     promotion = relationship("Promotion", back_populates="scenarios")
 
+# -------------------------
+# Assumption value parsing
+# -------------------------
+def parse_assumption_value(value):
+    """
+    (number, unit) from an assumption value such as '{"value":0.12}' or
+    '{"days":14}': the first numeric field, with its name as the unit unless
+    it is the generic "value". Anything non-numeric parses to (None, None).
+    """
+    try:
+        parsed = json.loads(value)
+    except (TypeError, ValueError):
+        return None, None
+    if isinstance(parsed, dict):
+        for unit, number in parsed.items():
+            if isinstance(number, (int, float)) and not isinstance(number, bool):
+                return float(number), None if unit == "value" else unit
+        return None, None
+    if isinstance(parsed, (int, float)) and not isinstance(parsed, bool):
+        return float(parsed), None
+    return None, None
+
 # -------------------------
 # Finance assumptions
 # -------------------------
@@ -64,9 +112,20 @@ class FinanceAssumption(Base):
     scenario_id = Column(Integer, ForeignKey("scenario.scenario_id", ondelete="CASCADE"), nullable=False)
     key = Column(String, nullable=False)
     value = Column(Text, nullable=False)
+    numeric_value = Column(Float)  # parsed from value on write
+    unit = Column(String)
 
     scenario = relationship("Scenario", back_populates="finance_assumptions")
 
+    __table_args__ = (
+        Index("ix_finance_assumption_lookup", "scenario_id", "key"),
+    )
+
+    @validates("value")
+    def parse_value(self, _, value):
+        self.numeric_value, self.unit = parse_assumption_value(value)
+        return value
+
 # -------------------------
 # Supply assumptions
 # -------------------------
@@ -76,9 +135,20 @@ class SupplyAssumption(Base):
     scenario_id = Column(Integer, ForeignKey("scenario.scenario_id", ondelete="CASCADE"), nullable=False)
     key = Column(String, nullable=False)
     value = Column(Text, nullable=False)
+    numeric_value = Column(Float)  # parsed from value on write
+    unit = Column(String)
 
     scenario = relationship("Scenario", back_populates="supply_assumptions")
 
+    __table_args__ = (
+        Index("ix_supply_assumption_lookup", "scenario_id", "key"),
+    )
+
+    @validates("value")
+    def parse_value(self, _, value):
+        self.numeric_value, self.unit = parse_assumption_value(value)
+        return value
+
 # -------------------------
 # Products
 # -------------------------
@@ -122,6 +192,19 @@ class Promotion(Base):
     retailer = relationship("Retailer", back_populates="promotions")
     scenarios = relationship("ScenarioPromotion", back_populates="promotion")
 
+    # Retailer-filtered keyset pages read promotions in id order per retailer
+    __table_args__ = (
+        Index("ix_promotion_retailer_page", "retailer_id", "id"),
+    )
+
+# -------------------------
+# Data versions (cache invalidation)
+# -------------------------
+class DataVersion(Base):
+    __tablename__ = "data_version"
+    table_name = Column(String, primary_key=True)
+    version = Column(String, nullable=False)
+
 # =========================
 # Initialize DB helper
 # =========================
@@ -0,0 +1,363 @@
+import math
+import threading
+import numpy as np
+from pulp import LpProblem, LpVariable, LpMaximize, lpSum, PULP_CBC_CMD, LpSolutionOptimal, LpSolutionIntegerFeasible
+from sqlalchemy import select, update, insert
+from models import Promotion, Product, Retailer, Scenario, ScenarioPromotion
+from db.versions import get_data_versions, bump_data_versions
+from config.settings import SELECTOR_TIME_LIMIT
+
+# Tables the promotion catalog snapshot is built from
+CATALOG_TABLES = ["promotion", "product", "retailer"]
+
+# Constraint types that do not restrict which promotions can be selected
+NON_SELECTION_CONSTRAINTS = {"promo_duration"}
+
+# Required field of each constraint type, and whether it must be a number
+CONSTRAINT_FIELDS = {
+    "max_budget": ("value", True),
+    "discount_limit": ("value", True),
+    "min_roi": ("value", True),
+    "min_lift": ("value", True),
+    "promo_duration": ("value", False),
+    "channel_include": ("channel", False),
+    "channel_exclude": ("channel", False),
+    "sku_focus": ("sku", False),
+    "sku_exclude": ("sku", False),
+}
+
+_catalog_lock = threading.Lock()
+_catalog = (None, None)   # (data versions, catalog arrays)
+
+
+# =============================
+# Catalog snapshot
+# =============================
+def load_catalog(db) -> dict:
+    """
+    Column arrays for every promotion, rebuilt only when the promotion,
+    product or retailer tables change.
+
+    Trade spend is estimated as discount_depth x est_incremental_revenue
+    (the promotion has no explicit cost column); ROI is profit / spend.
+    """
+    global _catalog
+    versions = get_data_versions(db, CATALOG_TABLES)
+    with _catalog_lock:
+        if _catalog[0] == versions and _catalog[1] is not None:
+            return _catalog[1]
+
+    rows = db.execute(
+        select(
+            Promotion.id,
+            Promotion.discount_depth,
+            Promotion.est_incremental_revenue,
+            Promotion.est_incremental_profit,
+            Retailer.name,
+            Product.sku,
+            Product.brand
+        )
+        .outerjoin(Product, Promotion.product_id == Product.id)
+        .outerjoin(Retailer, Promotion.retailer_id == Retailer.id)
+        .order_by(Promotion.id)
+    ).all()
+
+    ids, discount, revenue, profit, retailer, sku, brand = zip(*rows) if rows else ([],) * 7
+    catalog = build_catalog(ids, discount, revenue, profit, retailer, sku, brand)
+
+    with _catalog_lock:
+        _catalog = (versions, catalog)
+    return catalog
+
+
+def build_catalog(ids, discount, revenue, profit, retailer, sku, brand) -> dict:
+    """
+    Catalog arrays from per-promotion sequences (missing numbers count as 0).
+    Text columns also get a lower-cased "<name>_key" array for matching.
+    """
+    def num(values):
+        return np.array([v or 0.0 for v in values], dtype=float)
+
+    def text(values):
+        return np.array(list(values), dtype=object)
+
+    def key(values):
+        return np.array([(v or "").lower() for v in values], dtype=object)
+
+    discount = num(discount)
+    revenue = num(revenue)
+    return {
+        "id": np.array(ids, dtype=np.int64),
+        "discount": discount,
+        "revenue": revenue,
+        "profit": num(profit),
+        "spend": discount * revenue,
+        "retailer": text(retailer),
+        "sku": text(sku),
+        "brand": text(brand),
+        "retailer_key": key(retailer),
+        "sku_key": key(sku),
+        "brand_key": key(brand),
+    }
+
+
+# =============================
+# Vectorized prefilter
+# =============================
+def check_constraints(constraints) -> None:
+    """
+    Raise ValueError unless `constraints` is a list of constraint dicts in
+    the constraint_parser() format (known type, required field present,
+    numbers finite and budgets not negative).
+    """
+    if not isinstance(constraints, list):
+        raise ValueError("constraints must be a list")
+    for c in constraints:
+        if not isinstance(c, dict) or c.get("type") not in CONSTRAINT_FIELDS:
+            raise ValueError(f"Unknown constraint: {c!r}")
+        field, numeric = CONSTRAINT_FIELDS[c["type"]]
+        value = c.get(field)
+        if numeric:
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+        else:
+            valid = isinstance(value, str)
+        if not valid:
+            kind = "a finite number" if numeric else "a string"
+            raise ValueError(f"{c['type']} constraint needs '{field}' as {kind}")
+        if c["type"] == "max_budget" and value < 0:
+            raise ValueError("max_budget constraint needs a value of 0 or more")
+
+
+def _matches_product(catalog: dict, phrase: str) -> np.ndarray:
+    """Rows whose SKU or brand appears as a word in `phrase`."""
+    tokens = np.array(phrase.lower().split(), dtype=object)
+    return np.isin(catalog["sku_key"], tokens) | np.isin(catalog["brand_key"], tokens)
+
+
+def prefilter(catalog: dict, constraints: list):
+    """
+    Boolean mask of promotions that satisfy every per-promotion constraint
+    and have positive profit, plus the constraints that could not be applied.
+    """
+    mask = catalog["profit"] > 0
+    ignored = []
+
+    include = [c["channel"].lower() for c in constraints if c["type"] == "channel_include"]
+    if include:
+        mask &= np.isin(catalog["retailer_key"], include)
+    exclude = [c["channel"].lower() for c in constraints if c["type"] == "channel_exclude"]
+    if exclude:
+        mask &= ~np.isin(catalog["retailer_key"], exclude)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        roi = np.where(catalog["spend"] > 0, catalog["profit"] / catalog["spend"], np.inf)
+
+    for c in constraints:
+        if c["type"] == "discount_limit":
+            mask &= catalog["discount"] * 100 <= c["value"]
+        elif c["type"] == "min_roi":
+            mask &= roi >= c["value"]
+        elif c["type"] in ("sku_focus", "sku_exclude"):
+            # The parser captures free text after "only"/"exclude"; a phrase
+            # that names no SKU/brand in the catalog is not a product filter.
+            hit = _matches_product(catalog, c["sku"])
+            if not hit.any():
+                ignored.append(c)
+            elif c["type"] == "sku_focus":
+                mask &= hit
+            else:
+                mask &= ~hit
+        elif c["type"] == "min_lift":
+            # No baseline volume is stored, so lift cannot be computed
+            ignored.append(c)
+        elif c["type"] in NON_SELECTION_CONSTRAINTS:
+            ignored.append(c)
+
+    return mask, ignored
+
+
+# =============================
+# Solvers
+# =============================
+def _greedy(profit: np.ndarray, spend: np.ndarray, budget: float):
+    """
+    Greedy knapsack by profit/spend ratio plus the LP-relaxation bound.
+
+    Returns (chosen mask, upper bound, break ratio).
+    """
+    n = len(profit)
+    chosen = np.zeros(n, dtype=bool)
+    if n == 0:
+        return chosen, 0.0, 0.0
+
+    with np.errstate(divide="ignore"):
+        ratio = np.where(spend > 0, profit / np.maximum(spend, 1e-12), np.inf)
+    order = np.argsort(-ratio, kind="stable")
+    cum_spend = np.cumsum(spend[order])
+
+    # Longest prefix that fits, then the fractional break item for the LP bound
+    k = int(np.searchsorted(cum_spend, budget, side="right"))
+    chosen[order[:k]] = True
+    bound = float(profit[order[:k]].sum())
+    break_ratio = 0.0
+    if k < n:
+        brk = order[k]
+        left = budget - (cum_spend[k - 1] if k else 0.0)
+        bound += float(profit[brk] * left / spend[brk])
+        break_ratio = float(ratio[brk])
+
+        # Fill the remaining budget with smaller items past the break point
+        for i in order[k:]:
+            if spend[i] <= left:
+                chosen[i] = True
+                left -= spend[i]
+
+    # Single best item that fits (keeps the 1/2-approximation guarantee)
+    fits = spend <= budget
+    if fits.any():
+        best = int(np.argmax(np.where(fits, profit, -np.inf)))
+        if profit[best] > profit[chosen].sum():
+            chosen[:] = False
+            chosen[best] = True
+
+    return chosen, bound, break_ratio
+
+
+def _milp(profit: np.ndarray, spend: np.ndarray, budget: float, incumbent: np.ndarray,
+          bound: float, break_ratio: float, time_limit: float):
+    """
+    Exact 0/1 knapsack via CBC on the items reduced-cost fixing cannot decide.
+
+    With the LP multiplier r* (the break ratio), forcing item i against its
+    LP sign costs at least |p_i - r* w_i| of the bound, so any item where that
+    exceeds (bound - incumbent) is fixed to its LP value before solving.
+
+    Returns (chosen mask, status) where status is "Optimal", or "Feasible"
+    if the time budget ran out first (the better of CBC's and the incumbent).
+    """
+    gap = bound - float(profit[incumbent].sum())
+    reduced = profit - break_ratio * spend
+    decided = np.abs(reduced) > gap + 1e-9
+    fixed_in = decided & (reduced > 0)
+    core = np.flatnonzero(~decided)
+
+    chosen = fixed_in.copy()
+    if len(core) == 0:
+        return chosen, "Optimal"
+
+    prob = LpProblem("Promotion_Selection", LpMaximize)
+    x = {i: LpVariable(f"promo_{i}", cat="Binary") for i in core}
+    prob += lpSum(float(profit[i]) * x[i] for i in core), "Incremental Profit"
+    prob += lpSum(float(spend[i]) * x[i] for i in core) <= budget - float(spend[fixed_in].sum()), "Budget"
+
+    # No warm start: CBC has been seen to stop at a warm-started incumbent
+    # and report it as optimal; the incumbent is compared against below.
+    prob.solve(PULP_CBC_CMD(msg=False, timeLimit=time_limit))
+
+    if prob.sol_status not in (LpSolutionOptimal, LpSolutionIntegerFeasible) \
+            or any(x[i].varValue is None for i in core):
+        return incumbent, "Feasible"
+    for i in core:
+        chosen[i] = x[i].varValue > 0.5
+    if profit[chosen].sum() < profit[incumbent].sum():
+        return incumbent, "Feasible"
+    return chosen, "Optimal" if prob.sol_status == LpSolutionOptimal else "Feasible"
+
+
+def select_promotions(catalog: dict, constraints: list, mode: str = "fast",
+                      time_limit: float = SELECTOR_TIME_LIMIT) -> dict:
+    """
+    Choose the profit-maximizing set of promotions under the parsed constraints.
+
+    Args:
+        catalog (dict): Arrays from load_catalog() / build_catalog().
+        constraints (list): Output of bot.parser.constraint_parser().
+        mode (str): "fast" for greedy + LP bound, "exact" for MILP within time_limit.
+        time_limit (float): CBC time budget in seconds for mode="exact".
+
+    Returns:
+        dict: selected promotion ids, totals, LP upper bound and ignored constraints.
+    """
+    mask, ignored = prefilter(catalog, constraints)
+    candidates = np.flatnonzero(mask)
+    profit = catalog["profit"][candidates]
+    spend = catalog["spend"][candidates]
+
+    budgets = [c["value"] for c in constraints if c["type"] == "max_budget"]
+    if not budgets:
+        # Unconstrained spend: every profitable candidate is optimal
+        chosen, bound, method, status = np.ones(len(candidates), dtype=bool), float(profit.sum()), "all", "Optimal"
+    else:
+        budget = min(budgets)
+        chosen, bound, break_ratio = _greedy(profit, spend, budget)
+        method, status = "greedy", "Feasible"
+        if mode == "exact":
+            chosen, status = _milp(profit, spend, budget, chosen, bound, break_ratio, time_limit)
+            method = "milp"
+
+    selected = candidates[chosen]
+    total_profit = float(catalog["profit"][selected].sum())
+    return {
+        "status": status,
+        "method": method,
+        "selected_ids": catalog["id"][selected].tolist(),
+        "count": int(len(selected)),
+        "candidates": int(len(candidates)),
+        "profit": total_profit,
+        "revenue": float(catalog["revenue"][selected].sum()),
+        "spend": float(catalog["spend"][selected].sum()),
+        "bound": max(bound, total_profit),
+        "ignored_constraints": ignored,
+    }
+
+
+def selection_rows(catalog: dict, selected_ids: list) -> list:
+    """Table rows for the selected promotions, in promotion id order."""
+    idx = np.flatnonzero(np.isin(catalog["id"], selected_ids))
+    return [
+        {
+            "promotion_id": int(catalog["id"][i]),
+            "retailer": catalog["retailer"][i],
+            "sku": catalog["sku"][i],
+            "discount_depth": float(catalog["discount"][i]),
+            "est_spend": round(float(catalog["spend"][i]), 2),
+            "incremental_revenue": float(catalog["revenue"][i]),
+            "incremental_profit": float(catalog["profit"][i])
+        }
+        for i in idx
+    ]
+
+
+# =============================
+# Write-back
+# =============================
+def save_selection(db, scenario_id: int, selected_ids: list):
+    """
+    Store a selection on a scenario in bulk: clear every selected flag, flip
+    existing links by primary key and insert links for new promotions. The
+    scenario is marked as owning its selection, so a clone stops inheriting
+    its parent's even when nothing is selected.
+    """
+    existing = dict(db.execute(
+        select(ScenarioPromotion.promotion_id, ScenarioPromotion.id)
+        .where(ScenarioPromotion.scenario_id == scenario_id)
+    ).all())
+
+    db.execute(
+        update(ScenarioPromotion)
+        .where(ScenarioPromotion.scenario_id == scenario_id)
+        .values(selected=False)
+    )
+
+    to_update = [{"id": existing[p], "selected": True} for p in selected_ids if p in existing]
+    to_insert = [
+        {"scenario_id": scenario_id, "promotion_id": p, "selected": True}
+        for p in selected_ids if p not in existing
+    ]
+    if to_update:
+        db.execute(update(ScenarioPromotion), to_update)
+    if to_insert:
+        db.execute(insert(ScenarioPromotion), to_insert)
+
+    db.execute(update(Scenario).where(Scenario.scenario_id == scenario_id).values(owns_selection=True))
+    bump_data_versions(db, "scenario", "scenario_promotion")
@@ -0,0 +1,80 @@
+import sys
+import os
+from itertools import combinations
+
+# Ensure imports work when running from optimizer folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from optimizer.promo_selector import build_catalog, select_promotions, check_constraints
+
+
+def sample_catalog(n=12, seed=7):
+    rng = np.random.default_rng(seed)
+    return build_catalog(
+        ids=list(range(1, n + 1)),
+        discount=rng.uniform(0.05, 0.4, n).round(2).tolist(),
+        revenue=rng.uniform(1000, 9000, n).round().tolist(),
+        profit=rng.uniform(-500, 3000, n).round().tolist(),
+        retailer=["Walmart", "Costco", "Target"] * (n // 3),
+        sku=[f"SKU{i}" for i in range(n)],
+        brand=["BrandA", "BrandB"] * (n // 2),
+    )
+
+
+def brute_force(catalog, ids, budget):
+    idx = [int(np.flatnonzero(catalog["id"] == i)[0]) for i in ids]
+    best = 0.0
+    for r in range(len(idx) + 1):
+        for combo in combinations(idx, r):
+            if catalog["spend"][list(combo)].sum() <= budget:
+                best = max(best, catalog["profit"][list(combo)].sum())
+    return best
+
+
+def test_exact_matches_brute_force():
+    catalog = sample_catalog()
+    constraints = [{"type": "max_budget", "value": 2500.0}]
+    candidates = catalog["id"][catalog["profit"] > 0].tolist()
+
+    exact = select_promotions(catalog, constraints, mode="exact")
+    fast = select_promotions(catalog, constraints, mode="fast")
+
+    assert exact["status"] == "Optimal"
+    assert abs(exact["profit"] - brute_force(catalog, candidates, 2500.0)) < 1e-6
+    assert exact["spend"] <= 2500.0
+    assert fast["spend"] <= 2500.0
+    assert fast["profit"] <= exact["profit"] <= fast["bound"] + 1e-6
+
+
+def test_prefilter_constraints():
+    catalog = sample_catalog()
+    constraints = [
+        {"type": "channel_include", "channel": "Walmart"},
+        {"type": "discount_limit", "value": 30.0},
+        {"type": "min_lift", "value": 5.0},
+    ]
+    result = select_promotions(catalog, constraints)
+    chosen = np.isin(catalog["id"], result["selected_ids"])
+
+    assert (catalog["retailer"][chosen] == "Walmart").all()
+    assert (catalog["discount"][chosen] <= 0.30).all()
+    assert (catalog["profit"][chosen] > 0).all()
+    assert result["ignored_constraints"] == [{"type": "min_lift", "value": 5.0}]
+
+
+def test_check_constraints():
+    check_constraints([{"type": "max_budget", "value": 5000}, {"type": "channel_include", "channel": "Walmart"}])
+    for bad in ([{"type": "channel_include"}], [{"type": "max_budget", "value": "5k"}], [{"type": "bogus"}], "x",
+                [{"type": "max_budget", "value": -1}], [{"type": "min_roi", "value": float("nan")}],
+                [{"type": "discount_limit", "value": float("inf")}]):
+        with pytest.raises(ValueError):
+            check_constraints(bad)
+
+
+if __name__ == "__main__":
+    test_exact_matches_brute_force()
+    test_prefilter_constraints()
+    test_check_constraints()
+    print("All promotion selector tests passed.")
@@ -1,9 +1,9 @@
 #!/bin/bash
 
 echo "Initializing DB..."
-python3 db/loader.py
+python3 -m db.loader
 
-echo "Starting Flask app..."
-export FLASK_APP=app.py
-export FLASK_ENV=development
-flask run
+echo "Starting pre-fork server..."
+# Workers share the classifier weights loaded once by the master;
+# see `python3 serve.py --help` for worker/port options.
+python3 serve.py "$@"
@@ -0,0 +1,188 @@
+# serve.py
+"""
+Pre-fork server for the chat app.
+
+The master process imports the app once -- which loads the bart-large-mnli
+classifier -- builds the read-only promotion catalog snapshot, moves the model
+weights into shared memory, freezes the GC and then forks workers that serve
+from a shared listening socket. Workers see the
+weights through shared pages instead of each loading a private copy, so the
+number of workers per box is no longer bounded by model memory.
+
+    python3 serve.py --workers 4 --port 5000
+
+Send SIGUSR1 to the master to print RSS/PSS per process again.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from config.settings import (
+    SERVE_HOST, SERVE_PORT, SERVE_WORKERS, SERVE_TORCH_THREADS, SERVE_REPORT_DELAY
+)
+
+# -----------------------------
+# Memory reporting
+# -----------------------------
+def memory_usage(pid: int):
+    """
+    (RSS, PSS) in MiB for a process, read from /proc/<pid>/smaps_rollup.
+    PSS splits shared pages between the processes mapping them, so the sum of
+    PSS over master + workers is the real footprint. (None, None) off Linux.
+    """
+    rss = pss = None
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Rss:"):
+                    rss = int(line.split()[1]) / 1024
+                elif line.startswith("Pss:"):
+                    pss = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return rss, pss
+
+
+def format_mib(value):
+    return f"{value:8.1f}" if value is not None else "     n/a"
+
+
+def print_memory_report(title: str, pids: dict):
+    """pids: label -> pid"""
+    print(f"[serve] {title}")
+    print(f"[serve]   {'process':<12} {'pid':>7} {'RSS MiB':>8} {'PSS MiB':>8}")
+    total_pss = 0.0
+    for label, pid in pids.items():
+        rss, pss = memory_usage(pid)
+        total_pss += pss or 0.0
+        print(f"[serve]   {label:<12} {pid:>7} {format_mib(rss)} {format_mib(pss)}")
+    print(f"[serve]   {'total PSS':<12} {'':>7} {'':>8} {format_mib(total_pss)}")
+    sys.stdout.flush()
+
+# -----------------------------
+# Master: load once, share, fork
+# -----------------------------
+def preload():
+    """
+    Import the app (classifier + DB warm-up), build the read-only data
+    snapshots and make the model weights fork-friendly. Returns the Flask app.
+    """
+    from app import app
+    from bot import parser
+    from models import engine, SessionLocal
+    from optimizer.promo_selector import load_catalog
+
+    # Numpy catalog arrays are inherited copy-on-write; workers rebuild their
+    # own only after the promotion tables change.
+    db = SessionLocal()
+    try:
+        load_catalog(db)
+    finally:
+        db.close()
+
+    model = getattr(parser.classifier, "model", None)
+    if model is not None:
+        # Tensors in shared memory stay shared even if a worker writes to them,
+        # and the first call allocates any lazily created buffers pre-fork.
+        model.share_memory()
+        parser.classifier("warm up", parser.candidate_labels)
+
+    # Connections must not be inherited across fork
+    engine.dispose()
+
+    # Move everything allocated so far out of the GC's reach: collections in
+    # the workers would otherwise touch (and un-share) every object header.
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def run_worker(app, host: str, listen_fd: int, torch_threads: int):
+    from werkzeug.serving import make_server
+    from models import engine
+
+    # Drop the pool copied from the master without closing its connections
+    engine.dispose(close=False)
+
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+    signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server = make_server(host, 0, app, threaded=True, fd=listen_fd)
+    server.serve_forever()
+
+
+def spawn(app, host: str, listen_fd: int, torch_threads: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(app, host, listen_fd, torch_threads)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Pre-fork server for the OptiGuide chat app")
+    ap.add_argument("--host", default=SERVE_HOST)
+    ap.add_argument("--port", type=int, default=SERVE_PORT)
+    ap.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    ap.add_argument("--torch-threads", type=int, default=SERVE_TORCH_THREADS)
+    args = ap.parse_args()
+
+    master_pid = os.getpid()
+    print_memory_report("before model load", {"master": master_pid})
+    app = preload()
+    print_memory_report("after model load", {"master": master_pid})
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+    listen_fd = sock.fileno()
+
+    workers = {}
+    for i in range(args.workers):
+        workers[spawn(app, args.host, listen_fd, args.torch_threads)] = i
+    print(f"[serve] {args.workers} workers listening on http://{args.host}:{args.port}")
+
+    def report(*_):
+        pids = {"master": master_pid}
+        pids.update({f"worker-{i}": pid for pid, i in sorted(workers.items(), key=lambda w: w[1])})
+        print_memory_report("per-process memory", pids)
+
+    def shutdown(*_):
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGUSR1, report)
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    time.sleep(SERVE_REPORT_DELAY)
+    report()
+
+    # Respawn workers that die
+    while True:
+        pid, status = os.wait()
+        if pid in workers:
+            i = workers.pop(pid)
+            print(f"[serve] worker-{i} (pid {pid}) exited with status {status}; restarting")
+            workers[spawn(app, args.host, listen_fd, args.torch_threads)] = i
+
+
+if __name__ == "__main__":
+    main()